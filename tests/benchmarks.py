@@ -0,0 +1,242 @@
+"""
+Benchmark Suite with Baselines and Regression Flags
+
+The only timing in the repository is ntest2.test_runtime_scaling, a log-log
+fit inside a unit test.  This script runs fixed, parameterized workloads over
+every engine and records, per workload,
+  - wall time (best of --repeat untraced runs),
+  - peak traced memory (one extra run under tracemalloc, which also sees
+    NumPy buffers),
+  - throughput in workload units per second,
+to a JSON file.  Given a baseline file from an earlier run it flags every
+workload whose time or peak memory grew by more than --threshold, and exits
+with status 1 if any did.
+
+    python benchmarks.py --output run.json
+    python benchmarks.py --baseline run.json --output new.json --threshold 0.25
+    python benchmarks.py --quick --only 'totals|sampling'
+
+Workloads come in a full and a --quick size; results of different sizes are
+kept under different names, so they never compare against each other.
+"""
+
+import argparse
+import json
+import platform
+import re
+import sys
+import time
+import tracemalloc
+import unittest
+
+
+# -----------------------------------------------------------------------------
+# Workloads: each returns the number of units it processed.
+# -----------------------------------------------------------------------------
+
+def _totals_recurrence(n):
+    from ntest3 import compute_invariants
+    compute_invariants(n)
+    return n
+
+
+def _totals_fastpath(n):
+    from fastpath import compute_invariants_fast
+    compute_invariants_fast(n)
+    return n
+
+
+def _series_expansion(n):
+    import sympy as sp
+    from ntest3 import series_coefficients
+    x = sp.symbols('x')
+    series_coefficients(x * (1 - sp.sqrt(1 - 4 * x)) / (1 - 4 * x), n)
+    return n
+
+
+def _enumeration_nested(n):
+    from ntest2 import generate_trees
+    return len(generate_trees(n))
+
+
+def _enumeration_dyck(n):
+    from dyckenum import histograms
+    return int(histograms(n)["X"].sum())
+
+
+def _sampling_split_model(n, trees=50):
+    import random
+    from splitmodels import random_tree
+    rng = random.Random(0)
+    for _ in range(trees):
+        random_tree(n, rng=rng)
+    return n * trees
+
+
+def _sampling_boltzmann(n):
+    import numpy as np
+    from boltzmann import boltzmann_tree
+    left, _ = boltzmann_tree(n, rng=np.random.default_rng(0))
+    return (len(left) + 1) // 2
+
+
+def _evaluation_per_tree(n):
+    import numpy as np
+    from boltzmann import boltzmann_tree
+    from cophenetic import total_cophenetic
+    from montecarlo import tree_invariants
+    left, right = boltzmann_tree(n, rng=np.random.default_rng(1))
+    left, right = left.tolist(), right.tolist()
+    tree_invariants(left, right)
+    total_cophenetic(left, right)
+    return len(left)
+
+
+def _distribution_exact(n):
+    from tiledp import in_memory_distribution
+    table = in_memory_distribution("sackin", n)
+    return sum(len(row) for row in table[1:])
+
+
+def _distribution_float(n):
+    from chardist import distribution_table
+    return distribution_table("cherries", n).size
+
+
+# name -> (function, full argument, quick argument, unit)
+WORKLOADS = {
+    "totals_recurrence": (_totals_recurrence, 200, 80, "rows"),
+    "totals_fastpath": (_totals_fastpath, 1500, 300, "rows"),
+    "series_expansion": (_series_expansion, 40, 15, "coefficients"),
+    "enumeration_nested": (_enumeration_nested, 12, 9, "trees"),
+    "enumeration_dyck": (_enumeration_dyck, 14, 10, "trees"),
+    "sampling_split_model": (_sampling_split_model, 2000, 300, "leaves"),
+    "sampling_boltzmann": (_sampling_boltzmann, 10 ** 6, 10 ** 4, "leaves"),
+    "evaluation_per_tree": (_evaluation_per_tree, 10 ** 5, 10 ** 4, "nodes"),
+    "distribution_exact": (_distribution_exact, 45, 20, "cells"),
+    "distribution_float": (_distribution_float, 1000, 200, "cells"),
+}
+
+
+# -----------------------------------------------------------------------------
+# Running and comparing
+# -----------------------------------------------------------------------------
+
+def measure(function, argument, repeat=3):
+    """Best wall time over repeat runs, peak traced memory of one more run, units."""
+    best = float("inf")
+    units = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units = function(argument)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": best, "peak_bytes": peak, "units": units,
+            "throughput": units / best if best > 0 else float("inf")}
+
+
+def run_suite(only=None, quick=False, repeat=3, workloads=None, log=None):
+    """Run the selected workloads and return the JSON-ready result dict."""
+    workloads = workloads if workloads is not None else WORKLOADS
+    results = {}
+    for name, (function, full, small, unit) in workloads.items():
+        if only and not re.search(only, name):
+            continue
+        argument = small if quick else full
+        key = f"{name}[{argument}]"
+        if log:
+            log(f"{key} ...")
+        results[key] = dict(measure(function, argument, repeat), unit=unit)
+        if log:
+            r = results[key]
+            log(f"  {r['seconds']:.4f} s  {r['peak_bytes'] / 2 ** 20:.1f} MiB  "
+                f"{r['throughput']:.4g} {unit}/s")
+    import numpy
+    return {"meta": {"python": platform.python_version(), "numpy": numpy.__version__,
+                     "machine": platform.machine(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "results": results}
+
+
+def compare(current, baseline, threshold=0.2):
+    """
+    Workloads present in both runs whose time or peak memory grew by more than
+    the threshold fraction, as (name, metric, baseline value, current value).
+    """
+    flagged = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if result[metric] > base[metric] * (1 + threshold):
+                flagged.append((name, metric, base[metric], result[metric]))
+    return flagged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the tree-invariant benchmark suite.")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this earlier JSON result file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative growth of time and memory (default 0.2)")
+    parser.add_argument("--only", help="regular expression selecting workloads")
+    parser.add_argument("--quick", action="store_true", help="use the small workload sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per workload")
+    args = parser.parse_args(argv)
+
+    current = run_suite(args.only, args.quick, args.repeat, log=print)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        flagged = compare(current, baseline, args.threshold)
+        for name, metric, old, new in flagged:
+            growth = f" ({new / old - 1:+.0%})" if old else ""
+            print(f"REGRESSION {name} {metric}: {old:.4g} -> {new:.4g}{growth}")
+        if flagged:
+            return 1
+    return 0
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_measure_and_compare(self):
+        def work(n):
+            sum(range(n))
+            data = [0] * n
+            return len(data)
+
+        run = run_suite(workloads={"toy": (work, 10 ** 5, 10 ** 3, "items")}, quick=True, repeat=2)
+        result = run["results"]["toy[1000]"]
+        self.assertEqual(result["units"], 1000)
+        self.assertGreater(result["peak_bytes"], 8000)
+        self.assertEqual(result["unit"], "items")
+        slower = json.loads(json.dumps(run))
+        slower["results"]["toy[1000]"]["seconds"] = result["seconds"] * 2
+        self.assertEqual([f[:2] for f in compare(slower, run)], [("toy[1000]", "seconds")])
+        self.assertEqual(compare(run, slower), [])
+
+    def test_quick_workloads_run(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "run.json")
+            self.assertEqual(main(["--quick", "--repeat", "1", "--only", "fastpath|boltzmann",
+                                   "--output", path]), 0)
+            with open(path) as f:
+                run = json.load(f)
+            self.assertEqual(sorted(run["results"]),
+                             ["sampling_boltzmann[10000]", "totals_fastpath[300]"])
+            self.assertEqual(main(["--quick", "--repeat", "1", "--only", "fastpath",
+                                   "--baseline", path, "--threshold", "1000"]), 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
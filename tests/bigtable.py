@@ -0,0 +1,275 @@
+"""
+Binary Big-Integer Tables and Lazy Decimal Rendering
+
+Converting a Python int to decimal is quadratic in its size, and ntest1.py
+converts every coefficient twice just to decide whether to print it in
+scientific notation.  This module keeps coefficients binary:
+
+  - write_bigtable / BigTable store named integer columns as little-endian
+    two's-complement byte strings (int.to_bytes) behind a uint64 offset index,
+    so any entry is read back with one slice and int.from_bytes.  Reading maps
+    the file and touches only the requested entries.
+  - approx_decimal renders "d.ddddde+XX" from bit_length and the top 64 bits,
+    in O(1) regardless of the size of the integer.
+  - format_value reproduces the ntest1.py display rule (exact digits below 35
+    digits, scientific notation otherwise) using one comparison against 10^34
+    instead of str().
+  - Exact decimal strings are produced only on request and cached
+    (LazyDecimal, BigTable.exact).
+
+File layout (all integers little-endian):
+    8 bytes   magic b"UTTBIG1\\0"
+    uint32    number of columns, uint32 number of rows
+    per column: uint16 name length, UTF-8 name
+    uint64    (rows + 1) offsets per column, relative to the data section
+    data      concatenated entries
+"""
+
+import math
+import mmap
+import struct
+import sys
+import unittest
+from array import array
+from decimal import Decimal
+
+MAGIC = b"UTTBIG1\0"
+_LOG10_2 = math.log10(2)
+
+
+# -----------------------------------------------------------------------------
+# Display helpers
+# -----------------------------------------------------------------------------
+
+def approx_decimal(value, digits=5):
+    """
+    Scientific-notation string for an int of any size, e.g. '2.27692e+56',
+    computed from its top 64 bits without decimal conversion.
+    """
+    if value == 0:
+        return f"{0.0:.{digits}e}"
+    sign = "-" if value < 0 else ""
+    v = abs(value)
+    shift = max(0, v.bit_length() - 64)
+    log10v = math.log10(v >> shift) + shift * _LOG10_2
+    exponent = math.floor(log10v)
+    mantissa = round(10 ** (log10v - exponent), digits)
+    if mantissa >= 10:
+        mantissa /= 10
+        exponent += 1
+    return f"{sign}{mantissa:.{digits}f}e{'+' if exponent >= 0 else '-'}{abs(exponent):02d}"
+
+
+def format_value(value, max_digits=35, digits=5):
+    """
+    Display rule of ntest1.py: exact digits when the value has fewer than
+    max_digits digits, scientific notation otherwise.
+    """
+    if abs(value) < 10 ** (max_digits - 1):
+        return str(value)
+    return approx_decimal(value, digits)
+
+
+def exact_decimal(value):
+    """
+    Exact decimal string of an int.  Goes through decimal.Decimal, which is
+    not subject to the int-to-str digit limit.
+    """
+    return str(Decimal(value))
+
+
+class LazyDecimal:
+    """An int whose exact decimal string is computed once, on first use."""
+
+    __slots__ = ("value", "_text")
+
+    def __init__(self, value):
+        self.value = value
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            self._text = exact_decimal(self.value)
+        return self._text
+
+    def __repr__(self):
+        return f"LazyDecimal({approx_decimal(self.value)})"
+
+
+# -----------------------------------------------------------------------------
+# Binary tables
+# -----------------------------------------------------------------------------
+
+def _to_bytes(value):
+    return value.to_bytes(value.bit_length() // 8 + 1, "little", signed=True)
+
+
+def _le_offsets(offsets):
+    if sys.byteorder == "big":
+        offsets = array("Q", offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def write_bigtable(path, columns):
+    """
+    Write equal-length integer columns to path.
+    columns: dict mapping a column name to a sequence of ints.
+    """
+    names = list(columns)
+    rows = len(columns[names[0]]) if names else 0
+    if any(len(columns[name]) != rows for name in names):
+        raise ValueError("All columns must have the same length.")
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<II", len(names), rows))
+        for name in names:
+            encoded = name.encode("utf-8")
+            f.write(struct.pack("<H", len(encoded)))
+            f.write(encoded)
+        index_pos = f.tell()
+        f.write(b"\0" * 8 * len(names) * (rows + 1))
+        indexes = []
+        position = 0
+        for name in names:
+            offsets = array("Q", [position])
+            for value in columns[name]:
+                chunk = _to_bytes(value)
+                f.write(chunk)
+                position += len(chunk)
+                offsets.append(position)
+            indexes.append(offsets)
+        f.seek(index_pos)
+        for offsets in indexes:
+            f.write(_le_offsets(offsets))
+
+
+class BigTable:
+    """Memory-mapped reader for files written by write_bigtable."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:8] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a big-integer table.")
+        ncols, self.rows = struct.unpack_from("<II", self._map, 8)
+        pos = 16
+        self.columns = []
+        for _ in range(ncols):
+            (length,) = struct.unpack_from("<H", self._map, pos)
+            self.columns.append(self._map[pos + 2:pos + 2 + length].decode("utf-8"))
+            pos += 2 + length
+        self._index = {}
+        for name in self.columns:
+            offsets = array("Q")
+            offsets.frombytes(self._map[pos:pos + 8 * (self.rows + 1)])
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            self._index[name] = offsets
+            pos += 8 * (self.rows + 1)
+        self._data = pos
+        self._decimal = {}
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def raw(self, column, row):
+        """The stored bytes of one entry, without copying the rest of the file."""
+        offsets = self._index[column]
+        return memoryview(self._map)[self._data + offsets[row]:self._data + offsets[row + 1]]
+
+    def value(self, column, row):
+        """The integer stored at (column, row)."""
+        return int.from_bytes(self.raw(column, row), "little", signed=True)
+
+    def bit_length(self, column, row):
+        """Bit length of |entry|, read from the top bytes of nonnegative entries."""
+        raw = self.raw(column, row)
+        if raw[-1] >= 0x80:
+            return abs(self.value(column, row)).bit_length()
+        head = int.from_bytes(raw[-8:], "little")
+        return 8 * max(0, len(raw) - 8) + head.bit_length()
+
+    def approx(self, column, row, digits=5):
+        """Scientific-notation display of an entry, without decimal conversion."""
+        return approx_decimal(self.value(column, row), digits)
+
+    def exact(self, column, row):
+        """Exact decimal string of an entry, converted once and cached."""
+        key = (column, row)
+        if key not in self._decimal:
+            self._decimal[key] = exact_decimal(self.value(column, row))
+        return self._decimal[key]
+
+    def column(self, column):
+        """All integers of one column."""
+        return [self.value(column, row) for row in range(self.rows)]
+
+
+def export_totals(path, n_max):
+    """Write T, S, C, Phi, X and S2 for n = 0..n_max (row n = n leaves)."""
+    from fastpath import NAMES, compute_invariants_fast
+    write_bigtable(path, dict(zip(NAMES, compute_invariants_fast(n_max))))
+
+
+class TestBigTable(unittest.TestCase):
+
+    def test_round_trip(self):
+        import os
+        import tempfile
+        values = [0, 1, -1, 255, 256, -256, 2 ** 64, -(3 ** 500), 10 ** 1000]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "table.bin")
+            write_bigtable(path, {"a": values, "b": list(range(len(values)))})
+            with BigTable(path) as table:
+                self.assertEqual(table.columns, ["a", "b"])
+                self.assertEqual(table.rows, len(values))
+                self.assertEqual(table.column("a"), values)
+                self.assertEqual(table.column("b"), list(range(len(values))))
+                self.assertEqual(table.exact("a", 8), "1" + "0" * 1000)
+                self.assertEqual(table.approx("a", 7), approx_decimal(-(3 ** 500)))
+                for row, v in enumerate(values):
+                    self.assertEqual(table.bit_length("a", row), abs(v).bit_length())
+
+    def test_totals_export(self):
+        import os
+        import tempfile
+        from fastpath import compute_invariants_fast
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "totals.bin")
+            export_totals(path, 300)
+            expected = compute_invariants_fast(300)
+            with BigTable(path) as table:
+                self.assertEqual(table.column("Phi"), expected[3])
+                self.assertEqual(table.value("T", 300), expected[0][300])
+
+    def test_display_matches_ntest1_rule(self):
+        from fastpath import compute_invariants_fast
+        for seq in compute_invariants_fast(100):
+            for v in seq:
+                expected = str(v) if len(str(v)) < 35 else f"{v:.5e}"
+                self.assertEqual(format_value(v), expected)
+
+    def test_approx_beyond_float_range(self):
+        self.assertEqual(approx_decimal(10 ** 5000), "1.00000e+5000")
+        self.assertEqual(approx_decimal(2 ** 20000), "3.98028e+6020")
+        self.assertEqual(approx_decimal(-999999999), "-1.00000e+09")
+
+    def test_lazy_decimal(self):
+        lazy = LazyDecimal(7 ** 300)
+        self.assertIsNone(lazy._text)
+        self.assertEqual(str(lazy), str(7 ** 300))
+        self.assertEqual(len(str(LazyDecimal(10 ** 9000))), 9001)
+        self.assertIs(str(lazy), lazy._text)
+
+
+if __name__ == '__main__':
+    unittest.main()
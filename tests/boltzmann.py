@@ -0,0 +1,150 @@
+"""
+Boltzmann Sampler for Very Large Random Trees
+
+test5.random_full_binary_tree and splitmodels.random_tree draw every split
+from exact or tabulated split probabilities, which limits them to moderate n.
+A Boltzmann sampler for the class T = leaf + T x T uses the generating
+function T(x) = (1 - sqrt(1 - 4x)) / 2 instead: each node is independently
+a leaf with probability x / T(x) or an internal node with probability T(x),
+and a tree with n leaves is produced with probability proportional to
+T(n) x^n, i.e. uniformly among the trees of its size.
+
+Writing s = sqrt(1 - 4x), the expected number of leaves is (1 + s) / (2s),
+so s = 1 / (2n - 1) tunes the expectation to n; the node probabilities are
+then (1 + s) / 2 (leaf) and (1 - s) / 2 (internal).  Sizes are accepted in
+the window [(1 - eps) n, (1 + eps) n] and an attempt is abandoned as soon as
+it exceeds the window, which keeps the expected cost linear in n for fixed
+eps (Duchon, Flajolet, Louchard and Schaeffer, 2004).
+
+Node types are drawn in NumPy blocks as a pre-order word (the Lukasiewicz
+word); the tree is complete when the number of open slots drops to zero.
+Read backwards, a pre-order word is the post-order word of the mirrored
+tree, and mirroring is a bijection on trees of each size, so the reversed
+word is used directly.  In post-order, an internal node p has right child
+p - 1 and left child the previous node with the same stack height, found
+for all nodes at once with one stable sort.  No step recurses or touches
+nodes one at a time in Python, so trees with 10^7 leaves take seconds.
+"""
+
+import unittest
+
+import numpy as np
+
+from treearray import LEAF
+
+
+def boltzmann_parameter(n):
+    """(x, p_internal) with expected leaf count n (critical x = 1/4 as n grows)."""
+    s = 1.0 / (2 * n - 1)
+    return (1 - s * s) / 4, (1 - s) / 2
+
+
+def _attempt(p_internal, max_nodes, rng, block=64):
+    """
+    One Boltzmann attempt as a pre-order boolean word (True = internal), or
+    None if the tree grows beyond max_nodes.
+    """
+    parts = []
+    slots = 1
+    total = 0
+    while True:
+        internal = rng.random(block) < p_internal
+        # Open slots after each node: an internal node fills one and opens two.
+        level = slots + np.cumsum(np.where(internal, 1, -1), dtype=np.int64)
+        done = np.flatnonzero(level == 0)
+        if len(done):
+            end = done[0] + 1
+            if total + end > max_nodes:
+                return None
+            parts.append(internal[:end])
+            return np.concatenate(parts)
+        total += block
+        if total > max_nodes:
+            return None
+        parts.append(internal)
+        slots = level[-1]
+        block = min(2 * block, 1 << 22)
+
+
+def postorder_arrays(internal):
+    """
+    Post-order (left, right) int32 arrays of the tree whose post-order word
+    (True = internal node) is given.
+    """
+    m = len(internal)
+    height = np.cumsum(np.where(internal, -1, 1), dtype=np.int32)
+    order = np.argsort(height, kind="stable")
+    previous = np.full(m, LEAF, dtype=np.int32)
+    same = height[order[1:]] == height[order[:-1]]
+    previous[order[1:][same]] = order[:-1][same]
+    nodes = np.arange(m, dtype=np.int32)
+    left = np.where(internal, previous, LEAF).astype(np.int32)
+    right = np.where(internal, nodes - 1, LEAF).astype(np.int32)
+    return left, right
+
+
+def boltzmann_tree(n, eps=0.1, rng=None, stats=None):
+    """
+    Uniform random tree whose leaf count lies in [(1 - eps) n, (1 + eps) n]
+    (eps = 0 gives exactly n leaves, at a cost growing like n^1.5).  Returns
+    post-order (left, right) int32 NumPy arrays in the encoding of
+    treearray.py.  rng is a numpy.random.Generator; if stats is a dict, the
+    number of attempts and of generated nodes are added to it.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    _, p_internal = boltzmann_parameter(n)
+    low = max(1, int(np.ceil((1 - eps) * n)))
+    high = int((1 + eps) * n)
+    attempts = generated = 0
+    while True:
+        word = _attempt(p_internal, 2 * high - 1, rng)
+        attempts += 1
+        generated += 2 * high if word is None else len(word)
+        if word is not None and low <= (len(word) + 1) // 2:
+            break
+    if stats is not None:
+        stats["attempts"] = stats.get("attempts", 0) + attempts
+        stats["nodes"] = stats.get("nodes", 0) + generated
+    return postorder_arrays(word[::-1])
+
+
+class TestBoltzmann(unittest.TestCase):
+
+    def test_arrays_are_valid_trees(self):
+        from treearray import from_nested, num_leaves, to_nested
+        rng = np.random.default_rng(1)
+        for n in (1, 2, 10, 1000):
+            left, right = boltzmann_tree(n, eps=0.2, rng=rng)
+            leaves = num_leaves(left)
+            self.assertTrue((1 - 0.2) * n <= leaves <= (1 + 0.2) * n)
+            self.assertEqual(len(left), 2 * leaves - 1)
+            l2, r2 = from_nested(to_nested(left.tolist(), right.tolist()))
+            self.assertEqual((list(l2), list(r2)), (left.tolist(), right.tolist()))
+
+    def test_exact_size_is_uniform(self):
+        from treearray import to_nested
+        rng = np.random.default_rng(7)
+        n, draws = 5, 7000
+        counts = {}
+        for _ in range(draws):
+            left, right = boltzmann_tree(n, eps=0, rng=rng)
+            shape = to_nested(left.tolist(), right.tolist())
+            counts[shape] = counts.get(shape, 0) + 1
+        self.assertEqual(len(counts), 14)
+        # Chi-square with 13 degrees of freedom; 0.1% critical value 34.5.
+        expected = draws / 14
+        chi2 = sum((c - expected) ** 2 / expected for c in counts.values())
+        self.assertLess(chi2, 34.5)
+
+    def test_large_tree_linear_work(self):
+        rng = np.random.default_rng(3)
+        stats = {}
+        n = 200000
+        left, right = boltzmann_tree(n, rng=rng, stats=stats)
+        self.assertEqual(left.dtype, np.int32)
+        self.assertEqual(right[-1], len(left) - 2)
+        self.assertLess(stats["nodes"], 200 * n)
+
+
+if __name__ == '__main__':
+    unittest.main()
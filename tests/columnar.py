@@ -0,0 +1,324 @@
+"""
+Columnar Export of Invariant Tables and Distributions
+
+ntest3.py builds its tables row by row as lists of dicts and hands them to
+pandas.  Downstream jobs instead want (n, k, count) distribution tables and
+totals that can be scanned column by column without parsing.  This module
+writes Arrow-style columnar tables:
+
+    <table>/schema.json       column names, kinds and the row count
+    <table>/<col>.data        fixed-width little-endian values, one per row
+
+Column kinds:
+  - "int64", "float64":  plain fixed-width columns.
+  - "bigint":            a hybrid column.  <col>.data holds the value as int64
+                         whenever it fits and the sentinel -2^63 otherwise; the
+                         oversized values live in <col>.blob (int.to_bytes,
+                         little-endian two's complement) with per-row uint64
+                         offsets in <col>.offsets, so rows that fit occupy zero
+                         blob bytes (the layout of an Arrow binary column).
+
+ColumnarWriter streams: rows are buffered in chunks and appended to the column
+files, so a table never has to be resident in RAM; the schema (with the row
+count) is rewritten after every chunk, so an interrupted table keeps all of
+its flushed rows and append=True continues it.  ColumnarTable maps the files
+and returns NumPy memmap views, i.e. zero-copy reads of the fixed-width parts.
+"""
+
+import json
+import os
+import unittest
+
+import numpy as np
+
+SENTINEL = -2 ** 63
+_DTYPES = {"int64": "<i8", "float64": "<f8", "bigint": "<i8"}
+
+
+class ColumnarWriter:
+    """
+    Streaming writer.  schema is a dict (or list of pairs) mapping column name
+    to kind; use as a context manager or call close().
+    """
+
+    def __init__(self, directory, schema, chunk_rows=65536, append=False):
+        self.directory = directory
+        self.schema = dict(schema)
+        for name, kind in self.schema.items():
+            if kind not in _DTYPES:
+                raise ValueError(f"Unknown column kind {kind!r} for {name!r}.")
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+        if append and os.path.exists(os.path.join(directory, "schema.json")):
+            existing = ColumnarTable(directory)
+            if existing.schema != self.schema:
+                raise ValueError(f"Cannot append to {directory}: its schema is {existing.schema}.")
+            self.rows = existing.rows
+            self._truncate(existing)
+        mode = "ab" if self.rows else "wb"
+        self._files = {}
+        self._buffers = {name: [] for name in self.schema}
+        self._blob_position = {}
+        self._offsets = {}
+        for name, kind in self.schema.items():
+            self._files[name] = open(self._path(name, "data"), mode)
+            if kind == "bigint":
+                self._files[name, "blob"] = open(self._path(name, "blob"), mode)
+                self._files[name, "offsets"] = open(self._path(name, "offsets"), mode)
+                self._blob_position[name] = self._files[name, "blob"].tell()
+                self._offsets[name] = [] if self.rows else [0]
+
+    def _truncate(self, table):
+        """Drop bytes past the last committed row, e.g. from an interrupted run."""
+        for name, kind in self.schema.items():
+            os.truncate(self._path(name, "data"), 8 * self.rows)
+            if kind == "bigint":
+                offsets = table._map(name, "offsets", "<u8", self.rows + 1)
+                blob_size = int(offsets[-1])
+                os.truncate(self._path(name, "offsets"), 8 * (self.rows + 1))
+                os.truncate(self._path(name, "blob"), blob_size)
+        table._maps.clear()
+
+    def _path(self, name, suffix):
+        return os.path.join(self.directory, f"{name}.{suffix}")
+
+    def append(self, **row):
+        """Append one row given as keyword arguments."""
+        for name in self.schema:
+            self._buffers[name].append(row[name])
+        self.rows += 1
+        if len(self._buffers[next(iter(self.schema))]) >= self.chunk_rows:
+            self.flush()
+
+    def extend(self, columns):
+        """
+        Append a batch of rows given as a dict of equal-length sequences,
+        flushing every chunk_rows rows.
+        """
+        lengths = {len(columns[name]) for name in self.schema}
+        if len(lengths) != 1:
+            raise ValueError("All columns of a batch must have the same length.")
+        length = lengths.pop()
+        first = next(iter(self.schema))
+        start = 0
+        while start < length:
+            stop = min(length, start + self.chunk_rows - len(self._buffers[first]))
+            for name in self.schema:
+                self._buffers[name].extend(columns[name][start:stop])
+            self.rows += stop - start
+            start = stop
+            if len(self._buffers[first]) >= self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        """Write all buffered rows to the column files."""
+        for name, kind in self.schema.items():
+            values = self._buffers[name]
+            if not values:
+                continue
+            if kind == "bigint":
+                fixed = []
+                blob = self._files[name, "blob"]
+                offsets = self._offsets[name]
+                for v in values:
+                    if SENTINEL < v < -SENTINEL:
+                        fixed.append(v)
+                    else:
+                        chunk = v.to_bytes(v.bit_length() // 8 + 1, "little", signed=True)
+                        blob.write(chunk)
+                        self._blob_position[name] += len(chunk)
+                        fixed.append(SENTINEL)
+                    offsets.append(self._blob_position[name])
+                np.asarray(offsets, dtype="<u8").tofile(self._files[name, "offsets"])
+                self._offsets[name] = []
+                values = fixed
+            np.asarray(values, dtype=_DTYPES[kind]).tofile(self._files[name])
+            self._buffers[name] = []
+        for f in self._files.values():
+            f.flush()
+        self._write_schema()
+
+    def _write_schema(self):
+        path = os.path.join(self.directory, "schema.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"rows": self.rows,
+                       "columns": [[name, kind] for name, kind in self.schema.items()]}, f)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnarTable:
+    """Zero-copy reader for tables written by ColumnarWriter."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "schema.json")) as f:
+            meta = json.load(f)
+        self.rows = meta["rows"]
+        self.schema = {name: kind for name, kind in meta["columns"]}
+        self._maps = {}
+
+    def _map(self, name, suffix, dtype, count):
+        key = (name, suffix)
+        if key not in self._maps:
+            path = os.path.join(self.directory, f"{name}.{suffix}")
+            if count == 0:
+                self._maps[key] = np.zeros(0, dtype=dtype)
+            else:
+                self._maps[key] = np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+        return self._maps[key]
+
+    def column(self, name):
+        """
+        Memory-mapped view of the fixed-width part of a column.  For bigint
+        columns, rows equal to SENTINEL hold values stored in the blob.
+        """
+        return self._map(name, "data", _DTYPES[self.schema[name]], self.rows)
+
+    def oversized(self, name):
+        """Boolean mask of the rows of a bigint column that live in the blob."""
+        return self.column(name) == SENTINEL
+
+    def value(self, name, row):
+        """One entry as a Python int or float."""
+        fixed = self.column(name)[row]
+        if self.schema[name] != "bigint" or fixed != SENTINEL:
+            return fixed.item()
+        offsets = self._map(name, "offsets", "<u8", self.rows + 1)
+        blob = self._map(name, "blob", "u1", int(offsets[-1]))
+        start, stop = int(offsets[row]), int(offsets[row + 1])
+        return int.from_bytes(blob[start:stop].tobytes(), "little", signed=True)
+
+    def values(self, name):
+        """All entries of a column as Python numbers."""
+        if self.schema[name] != "bigint":
+            return self.column(name).tolist()
+        return [self.value(name, row) for row in range(self.rows)]
+
+
+# -----------------------------------------------------------------------------
+# Exporters
+# -----------------------------------------------------------------------------
+
+def export_totals(directory, n_max, chunk_rows=256):
+    """
+    Totals T, S, C, Phi, X, S2 for 1 <= n <= n_max, one row per n.  Rows come
+    from core.closed_form_rows and are written as they are produced, so only
+    the Colless history and one chunk are resident.
+    """
+    from core import closed_form_rows
+    from fastpath import NAMES
+    schema = [("n", "int64")] + [(name, "bigint") for name in NAMES]
+    with ColumnarWriter(directory, schema, chunk_rows) as writer:
+        for row in closed_form_rows(n_max):
+            writer.append(**dict(zip(("n",) + NAMES, row)))
+
+
+def export_distribution(directory, rows):
+    """
+    Stream (n, k, count) triples into a distribution table.  rows may be any
+    iterable, e.g. distribution_rows below, and is consumed lazily.
+    """
+    with ColumnarWriter(directory, [("n", "int64"), ("k", "int64"), ("count", "bigint")]) as writer:
+        for n, k, count in rows:
+            writer.append(n=n, k=k, count=count)
+
+
+def distribution_rows(patterns, n_max):
+    """
+    Yield (n, k, count) for the occurrence-count distribution of one pattern
+    (see patterns.py), in increasing n and k.
+    """
+    from patterns import PatternSet
+    D = PatternSet([patterns]).distributions(n_max)[0]
+    for n in range(1, n_max + 1):
+        for k in sorted(D[n]):
+            yield n, k, D[n][k]
+
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_totals_round_trip(self):
+        from fastpath import NAMES, compute_invariants_fast
+        path = os.path.join(self.tmp, "totals")
+        export_totals(path, 120)
+        table = ColumnarTable(path)
+        expected = compute_invariants_fast(120)
+        self.assertEqual(table.rows, 120)
+        self.assertIsInstance(table.column("n"), np.memmap)
+        self.assertEqual(table.values("n"), list(range(1, 121)))
+        for name, seq in zip(NAMES, expected):
+            self.assertEqual(table.values(name), seq[1:])
+        # Exactly the rows with T(n) >= 2^63 spill to the blob.
+        spilled = [n for n in range(1, 121) if expected[0][n] >= 2 ** 63]
+        self.assertEqual((np.flatnonzero(table.oversized("T")) + 1).tolist(), spilled)
+
+    def test_streamed_distribution(self):
+        from cherry import build_cherry_coeff_table
+        from patterns import CHERRY
+        path = os.path.join(self.tmp, "cherries")
+        export_distribution(path, distribution_rows(CHERRY, 40))
+        table = ColumnarTable(path)
+        ctable = build_cherry_coeff_table(39)
+        n, k = table.column("n"), table.column("k")
+        for row in range(table.rows):
+            self.assertEqual(table.value("count", row), ctable[int(n[row]) - 1][int(k[row])])
+
+    def test_chunked_writes_and_kinds(self):
+        path = os.path.join(self.tmp, "mixed")
+        values = [(-1) ** r * 7 ** r for r in range(100)]
+        with ColumnarWriter(path, {"x": "float64", "v": "bigint"}, chunk_rows=7) as writer:
+            for r, v in enumerate(values[:10]):
+                writer.append(x=r / 2, v=v)
+            flushes = []
+            flush, writer.flush = writer.flush, lambda: (flushes.append(writer.rows), flush())
+            writer.extend({"x": [r / 2 for r in range(10, 100)], "v": values[10:]})
+            self.assertEqual(flushes, list(range(14, 100, 7)))
+        table = ColumnarTable(path)
+        self.assertEqual(table.values("v"), values)
+        self.assertEqual(table.values("x"), [r / 2 for r in range(100)])
+        with self.assertRaises(ValueError):
+            ColumnarWriter(os.path.join(self.tmp, "bad"), {"x": "str"})
+
+    def test_append_after_interruption(self):
+        path = os.path.join(self.tmp, "resumed")
+        values = [(-3) ** (5 * r) for r in range(60)]
+        schema = {"r": "int64", "v": "bigint"}
+        writer = ColumnarWriter(path, schema, chunk_rows=8)
+        for r in range(30):
+            writer.append(r=r, v=values[r])
+        # Never closed: rows 24..29 are lost, partial bytes get truncated.
+        writer._files["v", "blob"].write(b"junk")
+        writer._files["v", "blob"].flush()
+        self.assertEqual(ColumnarTable(path).rows, 24)
+        with ColumnarWriter(path, schema, chunk_rows=8, append=True) as writer:
+            for r in range(writer.rows, 60):
+                writer.append(r=r, v=values[r])
+        table = ColumnarTable(path)
+        self.assertEqual(table.values("r"), list(range(60)))
+        self.assertEqual(table.values("v"), values)
+        with self.assertRaises(ValueError):
+            ColumnarWriter(path, {"r": "int64"}, append=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Conditioned Samplers: Uniform Trees with a Fixed Invariant Value
+
+Drawing a uniform tree among those with n leaves and invariant value k used to
+mean enumerating every tree with generate_full_binary_trees and filtering.
+The bivariate count tables c[n][k] of cherry.py / tiledp.py give a direct
+recursive decomposition instead: with the root terms f of tiledp.INVARIANTS,
+the trees counted by c[n][k] split as
+    c[n][k] = sum_i sum_a c[i][a] * c[n-i][k - f(n, i) - a],
+so choosing the pair (i, a) with probability proportional to its term and
+then drawing the two subtrees independently, each conditioned on its own
+value, yields an exactly uniform tree (all arithmetic is on Python ints).
+
+The candidate pairs and cumulative weights of each (n, k) are built once, on
+first use, and cached; a draw then costs one bisection per internal node,
+O(n log n) in total.  Construction is iterative and writes the post-order
+array encoding of treearray.py.
+"""
+
+import random
+import unittest
+from bisect import bisect_right
+from itertools import accumulate
+
+from tiledp import INVARIANTS, in_memory_distribution
+from treearray import LEAF
+
+
+class ConditionedSampler:
+    """
+    Uniform sampler of trees with n leaves and a given invariant value, for
+    n <= n_max.  table may be any object indexable as table[n] -> {k: count}
+    (a list from tiledp.in_memory_distribution, the default, or cherry tables
+    reindexed by leaves); a tiledp.TiledDistribution is used through row().
+    """
+
+    def __init__(self, invariant, n_max, table=None):
+        if invariant not in INVARIANTS:
+            raise ValueError(f"Unknown invariant {invariant!r}; choose from {sorted(INVARIANTS)}.")
+        self.invariant = invariant
+        self.n_max = n_max
+        self.root_term, _ = INVARIANTS[invariant]
+        if table is None:
+            table = in_memory_distribution(invariant, n_max)
+        elif hasattr(table, "row"):
+            table = [None] + [table.row(n) for n in range(1, n_max + 1)]
+        self.table = table
+        self._splits = {}
+
+    def count(self, n, k):
+        """Number of trees with n leaves and invariant value k."""
+        return self.table[n].get(k, 0)
+
+    def _split_table(self, n, k):
+        """Candidate pairs (i, a) of (n, k) and their cumulative weights."""
+        key = (n, k)
+        if key not in self._splits:
+            pairs = []
+            weights = []
+            for i in range(1, n):
+                rest = k - self.root_term(n, i)
+                right = self.table[n - i]
+                for a, x in self.table[i].items():
+                    y = right.get(rest - a, 0)
+                    if y:
+                        pairs.append((i, a))
+                        weights.append(x * y)
+            self._splits[key] = (pairs, list(accumulate(weights)))
+        return self._splits[key]
+
+    def sample(self, n, k, rng=random):
+        """
+        Draw a uniform tree among those with n leaves and invariant value k.
+        Returns post-order (left, right) lists.
+        """
+        if not 1 <= n <= self.n_max:
+            raise ValueError(f"n must lie in 1..{self.n_max}.")
+        if not self.count(n, k):
+            raise ValueError(f"No tree with {n} leaves has {self.invariant} = {k}.")
+        left = []
+        right = []
+        emitted = []
+        stack = [(n, k, False)]
+        while stack:
+            size, value, expanded = stack.pop()
+            if size == 1:
+                left.append(LEAF)
+                right.append(LEAF)
+                emitted.append(len(left) - 1)
+            elif expanded:
+                r = emitted.pop()
+                l = emitted.pop()
+                left.append(l)
+                right.append(r)
+                emitted.append(len(left) - 1)
+            else:
+                pairs, cumulative = self._split_table(size, value)
+                i, a = pairs[bisect_right(cumulative, rng.randrange(cumulative[-1]))]
+                stack.append((size, value, True))
+                stack.append((size - i, value - self.root_term(size, i) - a, False))
+                stack.append((i, a, False))
+        return left, right
+
+
+def invariant_value(invariant, left, right):
+    """Value of a tiledp invariant for an encoded tree."""
+    from treearray import leaves_below
+    size = leaves_below(left, right)
+    total = 0
+    for v in range(len(left)):
+        if left[v] != LEAF:
+            total += INVARIANTS[invariant][0](size[v], size[left[v]])
+    return total
+
+
+class TestConditioned(unittest.TestCase):
+
+    def test_values_and_uniformity(self):
+        from treearray import to_nested
+        rng = random.Random(5)
+        for invariant, n, k in (("cherries", 7, 2), ("colless", 7, 5), ("sackin", 6, 18)):
+            sampler = ConditionedSampler(invariant, n)
+            total = sampler.count(n, k)
+            draws = 40 * total
+            counts = {}
+            for _ in range(draws):
+                left, right = sampler.sample(n, k, rng)
+                self.assertEqual(invariant_value(invariant, left, right), k)
+                shape = to_nested(left, right)
+                counts[shape] = counts.get(shape, 0) + 1
+            self.assertEqual(len(counts), total)
+            # Every shape within 5 standard deviations of its expected count.
+            for c in counts.values():
+                self.assertLess(abs(c - 40), 5 * 40 ** 0.5)
+
+    def test_large_and_tiled_tables(self):
+        import os
+        import tempfile
+        from tiledp import TiledDistribution
+        rng = random.Random(11)
+        sampler = ConditionedSampler("cherries", 120)
+        left, right = sampler.sample(120, 40, rng)
+        self.assertEqual(len(left), 239)
+        self.assertEqual(invariant_value("cherries", left, right), 40)
+        with tempfile.TemporaryDirectory() as tmp:
+            tiled = TiledDistribution(os.path.join(tmp, "c"), "colless", tile_k=16)
+            tiled.build(25)
+            sampler = ConditionedSampler("colless", 25, tiled)
+            left, right = sampler.sample(25, 40, rng)
+            self.assertEqual(invariant_value("colless", left, right), 40)
+        with self.assertRaises(ValueError):
+            sampler.sample(25, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
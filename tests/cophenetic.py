@@ -0,0 +1,151 @@
+"""
+Per-Tree Total Cophenetic Index and the Cophenetic Matrix
+
+The total cophenetic index of a tree is
+    Phi(T) = sum over pairs of leaves {a, b} of depth(LCA(a, b)),
+and ntest2.py / ntest3.py only ever compute its total over all trees.  Per
+tree, each internal node v other than the root is the LCA-or-ancestor of
+binom(leaves(v), 2) pairs and adds one to each of their depths, so
+    Phi(T) = sum over internal v != root of binom(leaves(v), 2),
+one O(n) sweep over the post-order arrays of treearray.py.
+
+The full cophenetic matrix phi[a, b] = depth(LCA(a, b)) (with phi[a, a] the
+depth of leaf a) has n^2 entries, so it is produced as a stream of row blocks
+of bounded size.  Leaves are numbered in post-order, which makes the leaves of
+every subtree contiguous; then for a < b
+    phi[a, b] = min(D[a], ..., D[b - 1]),
+where D[t] is the depth of the LCA of the adjacent leaves t and t + 1 (the
+node whose right subtree starts at leaf t + 1).  Each row is two running
+minima over D, computed with numpy.minimum.accumulate.
+"""
+
+import unittest
+
+import numpy as np
+
+from treearray import LEAF, leaves_below, node_depths
+
+
+def total_cophenetic(left, right):
+    """Total cophenetic index Phi of an encoded tree, in O(n)."""
+    size = leaves_below(left, right)
+    root = len(left) - 1
+    total = 0
+    for v in range(root):
+        if left[v] != LEAF:
+            total += size[v] * (size[v] - 1) // 2
+    return total
+
+
+def adjacent_lca_depths(left, right):
+    """
+    Leaf depths and D[t] = depth(LCA(leaf t, leaf t + 1)) for the leaves in
+    post-order, as int32 arrays of lengths n and n - 1.
+    """
+    depth = node_depths(left, right)
+    nodes = len(left)
+    first = [0] * nodes      # post-order rank of the first leaf below each node
+    leaf_depth = []
+    D = np.zeros(max(0, (nodes + 1) // 2 - 1), dtype=np.int32)
+    for v in range(nodes):
+        if left[v] == LEAF:
+            first[v] = len(leaf_depth)
+            leaf_depth.append(depth[v])
+        else:
+            first[v] = first[left[v]]
+            D[first[right[v]] - 1] = depth[v]
+    return np.array(leaf_depth, dtype=np.int32), D
+
+
+def cophenetic_blocks(left, right, block_rows=None, max_bytes=64 << 20):
+    """
+    Yield (start, block) where block holds rows start..start + len(block) - 1
+    of the cophenetic matrix as an int32 array of shape (rows, n).  Without
+    block_rows, blocks are sized to stay within max_bytes.
+    """
+    leaf_depth, D = adjacent_lca_depths(left, right)
+    n = len(leaf_depth)
+    if block_rows is None:
+        block_rows = max(1, max_bytes // (4 * n))
+    for start in range(0, n, block_rows):
+        stop = min(n, start + block_rows)
+        block = np.empty((stop - start, n), dtype=np.int32)
+        for a in range(start, stop):
+            row = block[a - start]
+            row[a] = leaf_depth[a]
+            np.minimum.accumulate(D[a:], out=row[a + 1:])
+            if a:
+                row[:a] = np.minimum.accumulate(D[a - 1::-1])[::-1]
+        yield start, block
+
+
+def cophenetic_matrix(left, right):
+    """The full cophenetic matrix; only for trees small enough to hold n^2 entries."""
+    return np.vstack([block for _, block in cophenetic_blocks(left, right)])
+
+
+class TestCophenetic(unittest.TestCase):
+
+    @staticmethod
+    def brute_force(left, right):
+        """Cophenetic matrix from parent pointers and explicit ancestor sets."""
+        parent = {}
+        for v in range(len(left)):
+            if left[v] != LEAF:
+                parent[left[v]] = parent[right[v]] = v
+        depth = node_depths(left, right)
+        leaves = [v for v in range(len(left)) if left[v] == LEAF]
+
+        def ancestors(v):
+            path = [v]
+            while path[-1] in parent:
+                path.append(parent[path[-1]])
+            return path
+
+        paths = [ancestors(v) for v in leaves]
+        M = np.zeros((len(leaves), len(leaves)), dtype=np.int32)
+        for a, pa in enumerate(paths):
+            for b, pb in enumerate(paths):
+                common = set(pb)
+                M[a, b] = depth[next(v for v in pa if v in common)]
+        return M
+
+    def test_matches_totals(self):
+        from fastpath import compute_invariants_fast
+        from ntest2 import generate_trees
+        from treearray import from_nested
+        _, _, _, Phi, _, _ = compute_invariants_fast(9)
+        for n in range(1, 10):
+            total = sum(total_cophenetic(*from_nested(t)) for t in generate_trees(n))
+            self.assertEqual(total, Phi[n])
+
+    def test_matrix_against_brute_force(self):
+        import random
+        from splitmodels import random_tree
+        rng = random.Random(2)
+        for n in (1, 2, 3, 17, 60):
+            left, right = random_tree(n, rng=rng)
+            M = cophenetic_matrix(left, right)
+            np.testing.assert_array_equal(M, self.brute_force(left, right))
+            np.testing.assert_array_equal(M, M.T)
+            self.assertEqual(int(np.triu(M, 1).sum()), total_cophenetic(left, right))
+
+    def test_bounded_blocks_large_tree(self):
+        from boltzmann import boltzmann_tree
+        left, right = boltzmann_tree(100000, eps=0.05, rng=np.random.default_rng(0))
+        left, right = left.tolist(), right.tolist()
+        n = (len(left) + 1) // 2
+        max_bytes = 1 << 20
+        blocks = cophenetic_blocks(left, right, max_bytes=max_bytes)
+        start, block = next(blocks)
+        self.assertEqual(start, 0)
+        self.assertLessEqual(block.nbytes, max_bytes)
+        self.assertEqual(block.shape[1], n)
+        leaf_depth, _ = adjacent_lca_depths(left, right)
+        np.testing.assert_array_equal(block[np.arange(len(block)), np.arange(len(block))],
+                                      leaf_depth[:len(block)])
+        self.assertTrue((block <= leaf_depth[None, :]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Stdlib-Only Invariant Core
+
+Exact Catalan numbers and the totals of the uniform model without NumPy,
+sympy or even unittest, so that command-line lookups (treeinv.py) start in a
+few milliseconds.  The closed forms (readme.md Section 4)
+
+    S(n)  = 4^(n-1) - n T(n),         Phi(n) = (n-1) 4^(n-2) - binom(n, 2) T(n),
+    S2(n) = (4n^2 - n) T(n) - 3 * 4^(n-1),     X(n) = n (n-1) T(n) / (2 (2n-3)),
+
+with T(n) = T(n-1) * 2 (2n-3) / n need O(1) state per row; only Colless
+keeps the T and C histories for its recurrence
+    C(n) = sum_i [2 C(i) T(n-i) + |2i-n| T(i) T(n-i)].
+
+Unlike the other modules this one carries no test class; it is checked
+against the recurrence by membudget.py and test_treeinv.py.
+"""
+
+import math
+
+
+def catalan(n):
+    """The n-th Catalan number, i.e. T(n + 1)."""
+    return math.comb(2 * n, n) // (n + 1)
+
+
+def closed_form_rows(n_max, start=1, colless=True, C_history=None):
+    """
+    Yield (n, T, S, C, Phi, X, S2) for start <= n <= n_max.  With
+    colless=False C is None and memory stays O(1).  C_history, the totals
+    C[0..start-1] of an earlier run, saves recomputing them when resuming.
+    """
+    T_hist = [0]
+    C_hist = [0]
+    C_history = C_history or ()
+    T = 1
+    for n in range(1, n_max + 1):
+        if n > 1:
+            T = T * 2 * (2 * n - 3) // n
+        C = None
+        if colless:
+            T_hist.append(T)
+            if n < len(C_history):
+                C = C_history[n]
+            else:
+                C = sum(2 * C_hist[i] * T_hist[n - i] + abs(2 * i - n) * T_hist[i] * T_hist[n - i]
+                        for i in range(1, n))
+            C_hist.append(C)
+        if n < start:
+            continue
+        S = 4 ** (n - 1) - n * T
+        Phi = (n - 1) * 4 ** (n - 2) - n * (n - 1) // 2 * T if n >= 2 else 0
+        X = n * (n - 1) * T // (2 * (2 * n - 3)) if n >= 2 else 0
+        S2 = (4 * n * n - n) * T - 3 * 4 ** (n - 1)
+        yield n, T, S, C, Phi, X, S2
@@ -0,0 +1,108 @@
+"""
+Leaf-Depth Profile Engine
+
+The Sackin index S = sum_l d(l) and the Sackin2 index S2 = sum_l d(l)^2 are
+the first two moments of one object, the leaf-depth profile
+    P_n(d) = E[number of leaves at depth d]   (trees with n leaves).
+Under a split model q_n(i) (see splitmodels.py; the default is the uniform
+PDA model of ntest3.py) a leaf at depth d of the whole tree is a leaf at depth
+d - 1 of one of the two root subtrees, so
+    P_1(0) = 1,
+    P_n(d) = sum_i q_n(i) * (P_i(d-1) + P_{n-i}(d-1)) = 2 * sum_i q_n(i) * P_i(d-1),
+using the symmetry q_n(i) = q_n(n-i).  Each row is one vector-matrix product,
+and every depth moment E[sum_l d(l)^r] is a reduction of the table against
+d^r, so S, S2, S3, ... need no further DP code.
+"""
+
+import unittest
+from fractions import Fraction
+
+import numpy as np
+
+from splitmodels import pda
+
+
+def depth_profile(N, model=None, exact=False):
+    """
+    Expected leaf-depth profiles for 1 <= n <= N.
+    Returns an array P of shape (N + 1, N) with P[n, d] the expected number of
+    leaves at depth d among trees with n leaves (row 0 unused, P[n, d] = 0 for
+    d >= n).  The dtype is float64, or object holding Fractions when exact.
+    """
+    model = model or pda()
+    dtype = object if exact else float
+    zero = Fraction(0) if exact else 0.0
+    P = np.full((N + 1, max(N, 1)), zero, dtype=dtype)
+    if N >= 1:
+        P[1, 0] = Fraction(1) if exact else 1.0
+    for n in range(2, N + 1):
+        q = np.asarray(model.split_probabilities(n, exact), dtype=dtype)
+        # Subtrees with i <= n - 1 leaves have depths below n - 1.
+        P[n, 1:n] = 2 * q.dot(P[1:n, :n - 1])
+    return P
+
+
+def depth_moments(P, orders):
+    """
+    Reduce a profile table to depth moments.
+    Returns an array M of shape (len(orders), N + 1) with
+    M[k, n] = E[sum over leaves of depth^orders[k]] for trees with n leaves.
+    """
+    depths = np.arange(P.shape[1], dtype=P.dtype if P.dtype == object else float)
+    powers = np.stack([depths ** r for r in orders], axis=1)
+    return (P.dot(powers)).T
+
+
+def depth_moment(P, r):
+    """Return E[sum over leaves of depth^r] for every n as one array."""
+    return depth_moments(P, [r])[0]
+
+
+class TestDepthProfile(unittest.TestCase):
+
+    def test_profile_against_enumeration(self):
+        from ntest2 import generate_trees
+        N = 8
+        P = depth_profile(N, exact=True)
+        for n in range(1, N + 1):
+            trees = generate_trees(n)
+            counts = [0] * N
+            for tree in trees:
+                stack = [(tree, 0)]
+                while stack:
+                    t, d = stack.pop()
+                    if t == "L":
+                        counts[d] += 1
+                    else:
+                        stack.append((t[0], d + 1))
+                        stack.append((t[1], d + 1))
+            self.assertEqual(list(P[n]), [Fraction(c, len(trees)) for c in counts])
+
+    def test_moments_match_totals(self):
+        from ntest3 import compute_invariants
+        N = 30
+        T, S, _, _, _, S2 = compute_invariants(N)
+        P = depth_profile(N, exact=True)
+        M = depth_moments(P, [0, 1, 2])
+        Pf = depth_profile(N)
+        Mf = depth_moments(Pf, [1, 2])
+        for n in range(1, N + 1):
+            self.assertEqual(M[0, n], n)
+            self.assertEqual(M[1, n], Fraction(S[n], T[n]))
+            self.assertEqual(M[2, n], Fraction(S2[n], T[n]))
+            self.assertAlmostEqual(Mf[0, n], S[n] / T[n], delta=1e-12 * max(1, S[n] / T[n]))
+            self.assertAlmostEqual(Mf[1, n], S2[n] / T[n], delta=1e-12 * max(1, S2[n] / T[n]))
+
+    def test_third_moment_and_other_models(self):
+        from splitmodels import invariant_moments, yule
+        N = 40
+        mean, _ = invariant_moments(N, yule(), exact=True)
+        P = depth_profile(N, yule(), exact=True)
+        self.assertEqual(list(depth_moment(P, 1)[1:]), mean["S"][1:])
+        self.assertEqual(list(depth_moment(P, 2)[1:]), mean["S2"][1:])
+        # S3 for n = 3 under PDA: both shapes have depths {1, 2, 2}.
+        self.assertEqual(depth_moment(depth_profile(3, exact=True), 3)[3], 17)
+
+
+if __name__ == '__main__':
+    unittest.main()
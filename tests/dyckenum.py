@@ -0,0 +1,172 @@
+"""
+Block-Vectorized Enumeration of All Trees with NumPy Invariant Kernels
+
+generate_trees (ntest2.py) builds every tree as nested tuples, recursively,
+which caps brute-force checks at n = 8.  Here a tree with n leaves is its
+pre-order word of m = 2n - 1 node types (1 = internal, 0 = leaf; dropping the
+final leaf gives the usual Dyck word), and the T(n) words are produced in
+lexicographic order as uint8 blocks of shape (B, m):
+
+  - Unranking.  W[r][s], the number of valid completions of a word with r
+    symbols left and s open slots, satisfies W[0][0] = 1 and
+    W[r][s] = W[r-1][s-1] + W[r-1][s+1].  For a block of consecutive ranks
+    each position is decided for all rows at once: a leaf if the rank is
+    below W[r-1][s-1], otherwise an internal node after subtracting it.
+  - Kernels.  Read backwards, a pre-order word is the post-order word of the
+    mirrored tree, and every invariant here is mirror-symmetric.  A stack of
+    (leaves, S, S2) per subtree, shape (B, n), is updated column by column:
+    a leaf pushes (1, 0, 0), an internal node pops a, b and pushes
+        (a + b, S_a + S_b + a + b, S2_a + S2_b + 2 (S_a + S_b) + a + b),
+    adding |a - b| to Colless, binom(a + b, 2) to Phi (except at the root)
+    and one cherry when a = b = 1.
+
+Each block costs O(m) NumPy operations over B rows, and histograms() folds
+the per-tree values into exact value counts per invariant.
+"""
+
+import unittest
+
+import numpy as np
+
+INVARIANTS = ("X", "S", "C", "Phi", "S2")
+
+
+def completion_counts(n):
+    """W[r][s] for 0 <= r <= 2n - 1 and 0 <= s <= n + 1, as int64."""
+    m = 2 * n - 1
+    W = np.zeros((m + 1, n + 3), dtype=np.int64)
+    W[0, 0] = 1
+    for r in range(1, m + 1):
+        W[r, 1:n + 2] = W[r - 1, 0:n + 1] + W[r - 1, 2:n + 3]
+    return W
+
+
+def word_blocks(n, block=1 << 14, packed=False):
+    """
+    Yield (first_rank, words) for all T(n) pre-order words in lexicographic
+    order; words is uint8 of shape (rows, 2n - 1), or bit-packed along axis 1
+    with packed=True.
+    """
+    m = 2 * n - 1
+    W = completion_counts(n)
+    total = int(W[m, 1])
+    for start in range(0, total, block):
+        rank = np.arange(start, min(total, start + block), dtype=np.int64)
+        slots = np.ones(len(rank), dtype=np.int64)
+        words = np.empty((len(rank), m), dtype=np.uint8)
+        for t in range(m):
+            leaf_count = W[m - t - 1, slots - 1]
+            internal = rank >= leaf_count
+            rank -= np.where(internal, leaf_count, 0)
+            slots += np.where(internal, 1, -1)
+            words[:, t] = internal
+        yield start, (np.packbits(words, axis=1) if packed else words)
+
+
+def block_invariants(words, n):
+    """
+    Invariants of every tree in a block of pre-order words (uint8, shape
+    (B, 2n - 1)).  Returns a dict of int64 arrays keyed by INVARIANTS.
+    """
+    B, m = words.shape
+    rows = np.arange(B)
+    size = np.zeros((B, n + 1), dtype=np.int64)
+    sack = np.zeros((B, n + 1), dtype=np.int64)
+    sack2 = np.zeros((B, n + 1), dtype=np.int64)
+    sp = np.zeros(B, dtype=np.int64)
+    out = {name: np.zeros(B, dtype=np.int64) for name in INVARIANTS}
+    for t in range(m - 1, -1, -1):
+        internal = words[:, t].astype(bool)
+        leaf_rows = rows[~internal]
+        if len(leaf_rows):
+            top = sp[leaf_rows]
+            size[leaf_rows, top] = 1
+            sack[leaf_rows, top] = 0
+            sack2[leaf_rows, top] = 0
+            sp[leaf_rows] += 1
+        node_rows = rows[internal]
+        if len(node_rows):
+            hi = sp[node_rows] - 1
+            lo = hi - 1
+            a, b = size[node_rows, hi], size[node_rows, lo]
+            ab = a + b
+            s_sum = sack[node_rows, hi] + sack[node_rows, lo]
+            size[node_rows, lo] = ab
+            sack2[node_rows, lo] = sack2[node_rows, hi] + sack2[node_rows, lo] + 2 * s_sum + ab
+            sack[node_rows, lo] = s_sum + ab
+            out["C"][node_rows] += np.abs(a - b)
+            out["Phi"][node_rows] += ab * (ab - 1) // 2
+            out["X"][node_rows] += (a == 1) & (b == 1)
+            sp[node_rows] -= 1
+    out["S"] = sack[:, 0]
+    out["S2"] = sack2[:, 0]
+    # The root's binom(n, 2) is not part of Phi.
+    out["Phi"] -= n * (n - 1) // 2 if n > 1 else 0
+    return out
+
+
+def histograms(n, block=1 << 14):
+    """
+    Exact distributions over all T(n) trees: a dict mapping each invariant
+    to an int64 array of counts indexed by value.
+    """
+    hist = {name: np.zeros(1, dtype=np.int64) for name in INVARIANTS}
+    for _, words in word_blocks(n, block):
+        values = block_invariants(words, n)
+        for name in INVARIANTS:
+            counts = np.bincount(values[name])
+            if len(counts) > len(hist[name]):
+                counts[:len(hist[name])] += hist[name]
+                hist[name] = counts
+            else:
+                hist[name][:len(counts)] += counts
+    return hist
+
+
+class TestDyckEnumeration(unittest.TestCase):
+
+    def test_words_are_all_trees(self):
+        from boltzmann import postorder_arrays
+        from ntest2 import generate_trees
+        from treearray import from_nested
+        for n in range(1, 9):
+            words = np.vstack([w for _, w in word_blocks(n, block=17)])
+            self.assertEqual(len({w.tobytes() for w in words}), len(generate_trees(n)))
+            # Reversed words are post-order words of mirrored trees, which
+            # together are again all trees.
+            trees = {tuple(map(tuple, postorder_arrays(w[::-1].astype(bool)))) for w in words}
+            expected = {tuple(map(tuple, from_nested(t))) for t in generate_trees(n)}
+            self.assertEqual(trees, expected)
+        packed = next(word_blocks(6, packed=True))[1]
+        self.assertEqual(packed.shape, (42, 2))
+
+    def test_kernels_match_per_tree_values(self):
+        from boltzmann import postorder_arrays
+        from montecarlo import tree_invariants
+        n = 9
+        for _, words in word_blocks(n, block=500):
+            values = block_invariants(words, n)
+            for k in range(0, len(words), 37):
+                left, right = postorder_arrays(words[k][::-1].astype(bool))
+                S, C, Phi, X, S2 = tree_invariants(left.tolist(), right.tolist())
+                self.assertEqual([int(values[name][k]) for name in ("S", "C", "Phi", "X", "S2")],
+                                 [S, C, Phi, X, S2])
+
+    def test_histograms_match_tables(self):
+        from fastpath import compute_invariants_fast
+        from tiledp import in_memory_distribution
+        N = 13
+        totals = dict(zip(("T", "S", "C", "Phi", "X", "S2"), compute_invariants_fast(N)))
+        for n in (1, 2, 5, N):
+            hist = histograms(n, block=4096)
+            for invariant, name in (("cherries", "X"), ("sackin", "S"), ("colless", "C")):
+                expected = in_memory_distribution(invariant, n)[n]
+                got = {k: int(c) for k, c in enumerate(hist[name]) if c}
+                self.assertEqual(got, expected)
+            for name in ("Phi", "S2"):
+                self.assertEqual(int(hist[name].sum()), totals["T"][n])
+                self.assertEqual(int(hist[name].dot(np.arange(len(hist[name])))), totals[name][n])
+
+
+if __name__ == '__main__':
+    unittest.main()
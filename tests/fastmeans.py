@@ -0,0 +1,128 @@
+"""
+Floating-Point Means for Very Large n (uniform model)
+
+compute_invariants in ntest3.py carries every total as an exact integer of
+roughly 2n bits, which is O(n^2) big-integer work for values most analyses
+immediately divide by T(n).  This module works with normalized float64
+quantities instead and never forms a quantity larger than n^(5/2):
+
+    t(n)     = T(n) / 4^n                          (normalized Catalan numbers)
+    gamma(m) = binom(2m, m) / 4^m = [x^m] (1-4x)^(-1/2) / 4^m
+
+gamma is evaluated exactly (rounded once) for m < 64 and from its asymptotic
+series gamma(m) = (pi m)^(-1/2) (1 - 1/(8m) + 1/(128m^2) + ...) beyond, both to
+within a few ulps; t(n) = gamma(n-1) / (4n).  Both, and the FFT product used
+below, are shared with height.py.  The split distribution is
+q_n(i) = t(i) t(n-i) / t(n), and the means follow from the closed forms of the
+generating functions (readme.md Section 4 and Appendix A):
+
+    E[S]   = 1/(4 t(n)) - n                       S(n)   = 4^(n-1) - binom(2n-2, n-1)
+    E[Phi] = (n-1)/(16 t(n)) - n(n-1)/2           Phi(n) = (n-1) 4^(n-2) - (2n-3) binom(2n-4, n-2)
+    E[S2]  = 4n^2 - n - 3/(4 t(n))
+    E[X]   = n(n-1) / (2(2n-3))                    (n >= 2)
+
+Colless has no such closed form.  Its generating function is
+C(x) = R(x) / sqrt(1-4x) with R(n) = sum_i |2i-n| T(i) T(n-i); the half-range
+sum telescopes (Gosper) to
+    R(n) = 2 [ (2n-3) T(n-1) - m (2n-2m-1) T(m) T(n-m) ],   m = ceil(n/2),
+so E[C] = (r * gamma)(n) / t(n) with r(n) = R(n)/4^n, one FFT convolution.
+
+Accuracy: every closed-form mean has relative error below 1e-13 for all n; the
+FFT convolution keeps E[C] within a relative error of 1e-10 up to n = 10^7
+(checked against the exact recurrence for n <= 400 in the tests).  All means
+for n <= 10^7 take a few seconds, dominated by the Colless FFT.
+"""
+
+import math
+import unittest
+from fractions import Fraction
+
+import numpy as np
+
+from height import central_binomial_ratio, fft_mul_trunc, normalized_catalan
+
+
+def split_probabilities(n, t=None):
+    """Closed-form PDA split distribution q_n(i) = t(i) t(n-i) / t(n), i = 1..n-1."""
+    if t is None:
+        t = normalized_catalan(n)
+    return t[1:n] * t[n - 1:0:-1] / t[n]
+
+
+def normalized_means(N):
+    """
+    Float64 means of S, C, Phi, X and S2 over uniform trees with n leaves.
+    Returns a dict of arrays indexed by n (index 0 unused, n = 1 gives zeros).
+    """
+    gamma = central_binomial_ratio(N)
+    n = np.arange(N + 1, dtype=float)
+    t = np.zeros(N + 1)
+    t[1:] = gamma[:N] / (4 * n[1:])
+    inv_t = np.zeros(N + 1)
+    inv_t[1:] = 1.0 / t[1:]
+
+    means = {
+        "S": inv_t / 4 - n,
+        "Phi": (n - 1) * inv_t / 16 - n * (n - 1) / 2,
+        "S2": 4 * n * n - n - 3 * inv_t / 4,
+        "X": np.zeros(N + 1),
+    }
+    if N >= 2:
+        k = n[2:]
+        means["X"][2:] = k * (k - 1) / (2 * (2 * k - 3))
+
+    # Colless: r(n) = R(n)/4^n from the telescoped half-range sum.
+    r = np.zeros(N + 1)
+    if N >= 2:
+        idx = np.arange(2, N + 1)
+        m = (idx + 1) // 2
+        k = idx.astype(float)
+        r[2:] = 2 * ((2 * k - 3) * t[idx - 1] / 4 - m * (2 * k - 2 * m - 1) * t[m] * t[idx - m])
+        r[2] = 0.0
+    means["C"] = fft_mul_trunc(r, gamma, N + 1) * inv_t
+
+    for key in means:
+        means[key][:2] = 0.0
+    return means
+
+
+class TestNormalizedMeans(unittest.TestCase):
+
+    def test_against_exact_recurrence(self):
+        from ntest3 import compute_invariants
+        N = 400
+        T, S, C, Phi, X, S2 = compute_invariants(N)
+        means = normalized_means(N)
+        for name, totals, tol in (("S", S, 1e-13), ("Phi", Phi, 1e-13), ("X", X, 1e-13),
+                                  ("S2", S2, 1e-13), ("C", C, 1e-10)):
+            for n in range(2, N + 1):
+                exact = Fraction(totals[n], T[n])
+                if exact:
+                    rel = abs(Fraction(means[name][n]) / exact - 1)
+                    self.assertLess(rel, tol, (name, n))
+                else:
+                    self.assertAlmostEqual(means[name][n], 0.0, delta=1e-12)
+
+    def test_split_probabilities(self):
+        from splitmodels import pda
+        for n in (2, 7, 100):
+            np.testing.assert_allclose(split_probabilities(n), pda().split_probabilities(n), rtol=1e-12)
+            self.assertAlmostEqual(split_probabilities(n).sum(), 1.0, places=13)
+
+    def test_central_binomial_ratio(self):
+        gamma = central_binomial_ratio(3000)
+        for m in (0, 1, 63, 64, 65, 500, 3000):
+            exact = Fraction(math.comb(2 * m, m), 4 ** m)
+            self.assertLess(abs(Fraction(gamma[m]) / exact - 1), 1e-15)
+
+    def test_large_n_asymptotics(self):
+        N = 10 ** 6
+        means = normalized_means(N)
+        # E[S] ~ sqrt(pi) n^(3/2) and E[C] ~ sqrt(pi) n^(3/2) (Blum, Francois & Janson).
+        self.assertAlmostEqual(means["S"][N] / N ** 1.5 / math.sqrt(math.pi), 1, places=2)
+        self.assertAlmostEqual(means["C"][N] / N ** 1.5 / math.sqrt(math.pi), 1, delta=0.01)
+        self.assertAlmostEqual(means["X"][N] / N, 0.25, places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+"""
+Height Distribution Engine for Full Binary Trees
+
+Height is a maximum rather than a sum, so it does not fit the additive
+recurrences of ntest3.py (see readme.md Section 7).  It does fit the
+height-bounded family
+    T_0(x) = x,    T_h(x) = x + T_{h-1}(x)^2,
+where [x^n] T_h(x) counts trees with n leaves and height at most h.  Every
+series is truncated at x^N.
+
+Rather than squaring T_h directly we propagate the increments
+    D_h = T_h - T_{h-1}   (trees of height exactly h),
+    D_{h+1} = T_h^2 - T_{h-1}^2 = D_h * (T_h + T_{h-1}).
+D_h vanishes below x^(h+1) (a tree of height h has at least h + 1 leaves),
+so the product only needs D_h on [h+1, N] and T_h + T_{h-1} on [1, N-h-1];
+the operands shrink as h grows.  The iteration stops at the first h where
+D_h is zero on [0, N], i.e. where T_h has stabilized (h = N at the latest).
+
+Two modes are provided:
+  - exact:  integer coefficients, multiplied by Kronecker substitution (each
+            polynomial is packed into one big integer so the product runs in
+            CPython's Karatsuba multiplication).  Practical for N up to a few
+            hundred.
+  - float:  coefficients rescaled by 4^-n, which keeps every value near
+            n^(-3/2) and free of overflow, multiplied with NumPy FFTs.  The
+            rescaled Catalan numbers come from binom(2m, m) / 4^m, exact for
+            m < 64 and from its asymptotic series beyond (a few ulps).  Returns
+            probabilities P(height = h | n) with absolute error around 1e-13;
+            N = 5000 takes a few seconds.
+"""
+
+import math
+import unittest
+from fractions import Fraction
+
+import numpy as np
+
+
+# -----------------------------------------------------------------------------
+# Exact mode: Kronecker-substitution polynomial products
+# -----------------------------------------------------------------------------
+
+def _pack(coeffs, nbytes):
+    """Pack nonnegative coefficients into one integer, nbytes per slot."""
+    return int.from_bytes(b"".join(c.to_bytes(nbytes, "little") for c in coeffs), "little")
+
+
+def _unpack(value, count, nbytes):
+    """Inverse of _pack for the lowest `count` slots."""
+    raw = value.to_bytes(max(count * nbytes, (value.bit_length() + 7) // 8), "little")
+    return [int.from_bytes(raw[k * nbytes:(k + 1) * nbytes], "little") for k in range(count)]
+
+
+def poly_mul_trunc(a, b, count):
+    """
+    Return the first `count` coefficients of the product of two polynomials
+    with nonnegative integer coefficients (given lowest degree first).
+    """
+    if not a or not b or count <= 0:
+        return [0] * max(count, 0)
+    a = a[:count]
+    b = b[:count]
+    # Each product coefficient is at most min(len) * max(a) * max(b), so slots
+    # of this width never carry into each other.
+    bits = max(a).bit_length() + max(b).bit_length() + min(len(a), len(b)).bit_length()
+    nbytes = bits // 8 + 1
+    product = _pack(a, nbytes) * _pack(b, nbytes)
+    return _unpack(product, count, nbytes)
+
+
+def height_increments(N):
+    """
+    Exact height counts for all trees with at most N leaves.
+    Returns D where D[h][n] is the number of trees with n leaves and height
+    exactly h (lists of length N + 1, index 0 unused).
+    """
+    D_h = [0] * (N + 1)
+    D_h[1] = 1                      # T_0 = x: the single leaf
+    T_h = list(D_h)
+    T_prev = [0] * (N + 1)
+    D = [D_h]
+    h = 0
+    while True:
+        lo = h + 1                  # lowest degree present in D_h
+        width = N - lo              # degrees of D_{h+1} live in [lo + 1, N]
+        if width <= 0:
+            break
+        S = [T_h[k] + T_prev[k] for k in range(1, width + 1)]
+        prod = poly_mul_trunc(D_h[lo:], S, width)
+        D_next = [0] * (lo + 1) + prod
+        if not any(prod):
+            break
+        h += 1
+        T_prev = T_h
+        T_h = [t + d for t, d in zip(T_h, D_next)]
+        D_h = D_next
+        D.append(D_h)
+    return D
+
+
+def height_table(N):
+    """
+    Exact height distributions.
+    Returns H where H[n][h] is the number of trees with n leaves and height h,
+    for 1 <= n <= N and 0 <= h <= n - 1.
+    """
+    D = height_increments(N)
+    H = [[]] + [[0] * n for n in range(1, N + 1)]
+    for h, D_h in enumerate(D):
+        for n in range(h + 1, N + 1):
+            H[n][h] = D_h[n]
+    return H
+
+
+# -----------------------------------------------------------------------------
+# Float mode: normalized coefficients and FFT products
+# -----------------------------------------------------------------------------
+
+def fft_mul_trunc(a, b, count):
+    """
+    Return the first `count` coefficients of the product of two series with
+    nonnegative float coefficients (arrays, lowest degree first), via real
+    FFTs; the float counterpart of poly_mul_trunc, also used by fastmeans.py.
+    """
+    size = 1 << max(1, (len(a) + len(b) - 1).bit_length())
+    prod = np.fft.irfft(np.fft.rfft(a, size) * np.fft.rfft(b, size), size)[:count]
+    # Products of nonnegative series are nonnegative; clip FFT round-off.
+    return np.maximum(prod, 0.0)
+
+
+_SERIES_CUTOFF = 64
+# Asymptotic series of sqrt(m) * Gamma(m + 1/2) / Gamma(m + 1).
+_GAMMA_SERIES = (1.0, -1 / 8, 1 / 128, 5 / 1024, -21 / 32768, -399 / 262144, 869 / 4194304)
+
+
+def central_binomial_ratio(M):
+    """Return gamma with gamma[m] = binom(2m, m) / 4^m for 0 <= m <= M."""
+    gamma = np.empty(M + 1)
+    small = min(M + 1, _SERIES_CUTOFF)
+    gamma[:small] = [float(Fraction(math.comb(2 * m, m), 4 ** m)) for m in range(small)]
+    if M >= _SERIES_CUTOFF:
+        m = np.arange(_SERIES_CUTOFF, M + 1, dtype=float)
+        inv = 1.0 / m
+        acc = np.full_like(m, _GAMMA_SERIES[-1])
+        for c in _GAMMA_SERIES[-2::-1]:
+            acc = acc * inv + c
+        gamma[_SERIES_CUTOFF:] = acc / np.sqrt(math.pi * m)
+    return gamma
+
+
+def normalized_catalan(N):
+    """Return t with t[n] = T(n) / 4^n for 1 <= n <= N (t[0] = 0)."""
+    t = np.zeros(N + 1)
+    if N >= 1:
+        n = np.arange(1, N + 1, dtype=float)
+        t[1:] = central_binomial_ratio(N - 1) / (4 * n)
+    return t
+
+
+def height_probabilities(N, tol=0.0):
+    """
+    Probabilities P(height = h | n) under the uniform model, for all n <= N.
+    Returns a float64 array P of shape (N + 1, H + 1), row 0 unused, where H is
+    the largest height reached before every remaining probability falls to
+    `tol` or below (tol = 0.0 runs until T_h stabilizes in floating point).
+    """
+    t = normalized_catalan(N)
+    d_h = np.zeros(N + 1)
+    d_h[1] = 0.25                   # x / 4
+    t_h = d_h.copy()
+    t_prev = np.zeros(N + 1)
+    columns = [d_h]
+    h = 0
+    while True:
+        lo = h + 1
+        width = N - lo
+        if width <= 0:
+            break
+        prod = fft_mul_trunc(d_h[lo:], (t_h + t_prev)[1:width + 1], width)
+        d_next = np.zeros(N + 1)
+        d_next[lo + 1:] = prod
+        if not (d_next[1:] / t[1:] > tol).any():
+            break
+        h += 1
+        t_prev = t_h
+        t_h = t_h + d_next
+        d_h = d_next
+        columns.append(d_h)
+    P = np.stack(columns, axis=1)
+    P[1:] /= t[1:, None]
+    return P
+
+
+# -----------------------------------------------------------------------------
+# Brute force reference
+# -----------------------------------------------------------------------------
+
+def tree_height(tree):
+    """Height of a nested-tuple tree (a leaf has height 0)."""
+    if tree == "L":
+        return 0
+    return 1 + max(tree_height(tree[0]), tree_height(tree[1]))
+
+
+class TestHeight(unittest.TestCase):
+
+    def test_exact_matches_enumeration(self):
+        from ntest2 import generate_trees
+        N = 10
+        H = height_table(N)
+        for n in range(1, N + 1):
+            counts = [0] * n
+            for tree in generate_trees(n):
+                counts[tree_height(tree)] += 1
+            self.assertEqual(H[n], counts)
+
+    def test_exact_totals_are_catalan(self):
+        N = 60
+        H = height_table(N)
+        for n in range(1, N + 1):
+            self.assertEqual(sum(H[n]), math.comb(2 * n - 2, n - 1) // n)
+        # Extremes: the caterpillar family has height n - 1 (2^(n-2) ordered
+        # trees) and the perfect tree is the only one of height log2(n).
+        self.assertEqual(H[N][N - 1], 2 ** (N - 2))
+        self.assertEqual(height_table(32)[32][5], 1)
+
+    def test_kronecker_product(self):
+        a = [3, 0, 2 ** 70, 5]
+        b = [1, 2 ** 40, 7]
+        full = [0] * 6
+        for i, x in enumerate(a):
+            for j, y in enumerate(b):
+                full[i + j] += x * y
+        self.assertEqual(poly_mul_trunc(a, b, 6), full)
+        self.assertEqual(poly_mul_trunc(a, b, 3), full[:3])
+
+    def test_float_matches_exact(self):
+        N = 120
+        H = height_table(N)
+        P = height_probabilities(N)
+        for n in range(1, N + 1):
+            total = sum(H[n])
+            for h in range(min(n, P.shape[1])):
+                self.assertAlmostEqual(P[n, h], H[n][h] / total, delta=1e-12)
+            self.assertAlmostEqual(P[n].sum(), 1.0, delta=1e-12)
+
+    def test_float_large_n(self):
+        P = height_probabilities(2000, tol=1e-300)
+        self.assertAlmostEqual(P[2000].sum(), 1.0, delta=1e-9)
+        # The mean height grows like 2*sqrt(pi*n).
+        mean = (P[2000] * np.arange(P.shape[1])).sum()
+        self.assertLess(abs(mean / (2 * math.sqrt(math.pi * 2000)) - 1), 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
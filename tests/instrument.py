@@ -0,0 +1,165 @@
+"""
+Opt-In Instrumentation of the Invariant Engines
+
+cProfile attributes time to Python functions, but the DP's cost sits inside
+big-integer multiplications whose price depends on operand size.  While a
+Profiler is active (with profiling(): ...), the engines report
+
+  - multiplications and additions per phase (e.g. "fastpath.S:bigint"),
+  - a histogram of product sizes, bucketed by powers of two of
+    bits(a) + bits(b), and the schoolbook cost proxy sum bits(a) * bits(b),
+  - wall time per n-row of each engine,
+  - hit and miss counts of their caches.
+
+Engines look up `instrument.current` once per call or per row and skip all
+bookkeeping when it is None, so the inner loops are unchanged and disabled
+instrumentation costs one comparison per row.  report() returns a JSON-ready
+dict, and save() writes it to a file.
+"""
+
+import json
+import time
+import unittest
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+current = None
+
+
+class Profiler:
+    """Counters filled by the engines while this profiler is active."""
+
+    def __init__(self):
+        self.ops = defaultdict(lambda: {"mul": 0, "add": 0, "bit_products": 0})
+        self.bits = defaultdict(Counter)
+        self.rows = defaultdict(list)
+        self.caches = defaultdict(lambda: [0, 0])
+
+    def count(self, phase, mul=0, add=0):
+        """Record operations whose operand sizes are not tracked."""
+        entry = self.ops[phase]
+        entry["mul"] += mul
+        entry["add"] += add
+
+    def products(self, phase, a_bits, b_bits, add=None):
+        """
+        Record the elementwise products of two operand vectors, given as bit
+        lengths, and (by default) the additions that sum them.
+        """
+        entry = self.ops[phase]
+        histogram = self.bits[phase]
+        count = 0
+        for x, y in zip(a_bits, b_bits):
+            count += 1
+            entry["bit_products"] += x * y
+            histogram[1 << max(0, (x + y).bit_length() - 1) if x + y else 0] += 1
+        entry["mul"] += count
+        entry["add"] += max(0, count - 1) if add is None else add
+
+    def row(self, engine, n, seconds):
+        self.rows[engine].append((n, seconds))
+
+    def cache(self, name, hit):
+        self.caches[name][0 if hit else 1] += 1
+
+    def report(self):
+        """All counters as plain dicts and lists."""
+        return {
+            "ops": {phase: dict(entry) for phase, entry in sorted(self.ops.items())},
+            "product_bits": {phase: {str(k): v for k, v in sorted(hist.items())}
+                             for phase, hist in sorted(self.bits.items())},
+            "rows": {engine: {"n": [n for n, _ in rows], "seconds": [t for _, t in rows],
+                              "total_seconds": sum(t for _, t in rows)}
+                     for engine, rows in self.rows.items()},
+            "caches": {name: {"hits": h, "misses": m, "hit_rate": h / (h + m) if h + m else None}
+                       for name, (h, m) in self.caches.items()},
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+@contextmanager
+def profiling(profiler=None):
+    """Activate a Profiler (a new one by default) for the duration of the block."""
+    global current
+    previous = current
+    current = profiler if profiler is not None else Profiler()
+    try:
+        yield current
+    finally:
+        current = previous
+
+
+def bit_lengths(values):
+    """Bit lengths of a sequence of ints (Python or NumPy)."""
+    return [abs(int(v)).bit_length() for v in values]
+
+
+class Timer:
+    """Row timer: Timer(profiler) is a no-op when profiler is None."""
+
+    __slots__ = ("profiler", "engine", "n", "start")
+
+    def __init__(self, profiler, engine, n):
+        self.profiler = profiler
+        self.engine = engine
+        self.n = n
+
+    def __enter__(self):
+        if self.profiler is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.row(self.engine, self.n, time.perf_counter() - self.start)
+
+
+class TestInstrument(unittest.TestCase):
+
+    # The engines import this file as `instrument`, which is a different module
+    # object from __main__ when it is run as a script.
+
+    def test_fastpath_counters(self):
+        import instrument
+        from fastpath import PLAIN_BELOW, compute_invariants_fast
+        N = PLAIN_BELOW + 20
+        plain = compute_invariants_fast(N)
+        with instrument.profiling() as prof:
+            self.assertEqual(compute_invariants_fast(N), plain)
+        self.assertIsNone(instrument.current)
+        report = prof.report()
+        self.assertEqual(report["rows"]["fastpath"]["n"], list(range(3, N + 1)))
+        # T(n) = sum_i T(i) T(n-i): n - 1 products per row.
+        total_T = sum(v["mul"] for k, v in report["ops"].items() if k.startswith("fastpath.T:"))
+        self.assertEqual(total_T, sum(n - 1 for n in range(3, N + 1)))
+        self.assertIn("fastpath.S:bigint", report["ops"])
+        self.assertIn("fastpath.S:int64", report["ops"])
+        big = report["product_bits"]["fastpath.T:bigint"]
+        self.assertEqual(sum(big.values()), report["ops"]["fastpath.T:bigint"]["mul"])
+        json.dumps(report)
+
+    def test_tiledp_caches_and_nesting(self):
+        import os
+        import tempfile
+        import instrument
+        from tiledp import TiledDistribution
+        outer = instrument.Profiler()
+        with tempfile.TemporaryDirectory() as tmp:
+            with instrument.profiling(outer):
+                with instrument.profiling() as inner:
+                    TiledDistribution(os.path.join(tmp, "s"), "sackin", tile_k=8).build(12)
+                self.assertIs(instrument.current, outer)
+        report = inner.report()
+        cache = report["caches"]["tiledp.tiles"]
+        self.assertGreater(cache["hits"], 0)
+        self.assertGreater(cache["misses"], 0)
+        self.assertEqual(report["rows"]["tiledp"]["n"], list(range(2, 13)))
+        self.assertGreater(report["ops"]["tiledp.poly_mul"]["mul"], 0)
+        self.assertEqual(outer.report()["ops"], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+"""
+Memory Accounting and Budgets for the Table Builders
+
+The totals DP keeps six lists of big integers (ntest3.py), the bivariate DP
+keeps every row of c[n][k] (cherry.py, tiledp.in_memory_distribution), and
+brute force keeps every tree in `memo` (cherry.generate_full_binary_trees).
+This module predicts and measures what each of them needs and picks a mode
+that fits a budget.
+
+Bytes-per-entry model (CPython 3.11, 64-bit): an int of b bits takes
+24 + 4 * ceil(b / 30) bytes; a total also occupies 24 bytes of array and list
+slots, a (k, count) pair of a bivariate row about 48 bytes of dict slot and
+key over the attainable range of k, and a brute-force shape ("node", L, R) a
+64-byte tuple plus its 8-byte list slot.  Bit lengths use the bounds of
+fastpath.py (T(n) < 4^(n-1), invariants <= n^3 T(n)), and measured peaks
+stay within a factor of two of the model; measure_peak checks it with
+tracemalloc.
+
+Builders under a MemoryBudget:
+  - build_totals: in memory while the six lists fit; otherwise the rows of
+    core.closed_form_rows (closed forms for T, S, Phi, X and S2, only the T
+    and C histories of the Colless recurrence resident) are streamed to a
+    columnar.py table, provided those histories, one chunk of rows and the
+    file buffers fit ("totals_stream"); otherwise MemoryError.
+  - build_distribution: in memory while the table fits, otherwise spilled
+    to disk as a tiledp.TiledDistribution within the budget.
+  - cherry_distribution_bruteforce: enumerates with cherry.py's memo while
+    it fits, otherwise streams Dyck-word blocks (dyckenum.py) sized to the
+    budget.
+"""
+
+import io
+import math
+import tempfile
+import tracemalloc
+import unittest
+
+from core import closed_form_rows
+from fastpath import NAMES, predicted_bits
+from tiledp import INVARIANTS
+
+_LIST_SLOT = 8
+# fastpath keeps an object array, an int64 array and the output list per entry.
+_TOTALS_SLOTS = 3 * 8
+_DICT_ENTRY = 48
+_SHAPE = 64 + _LIST_SLOT
+# Rows buffered by the streamed totals writer before each flush, and a
+# fixed allowance for its file objects and flush temporaries.
+_STREAM_CHUNK = 16
+_STREAM_OVERHEAD = 64 << 10
+
+
+def int_bytes(bits):
+    """Size of a CPython int with the given bit length."""
+    return 24 + 4 * max(1, -(-bits // 30))
+
+
+def _k_min(kind, n):
+    """Smallest attainable value of an invariant at n leaves."""
+    if kind == "sackin":
+        h = n.bit_length() - 1
+        return n * (h + 2) - 2 ** (h + 1)
+    return 0
+
+
+def estimate_bytes(kind, n_max):
+    """
+    Predicted resident bytes of a build up to n_max: kind is "totals", an
+    invariant of tiledp.INVARIANTS, "shapes" (brute-force memo, n_max
+    internal nodes) or "totals_stream" (the streamed fallback of totals).
+    """
+    if kind == "totals":
+        return sum(int_bytes(predicted_bits(name, n)) + _TOTALS_SLOTS
+                   for n in range(1, n_max + 1) for name in NAMES)
+    if kind == "totals_stream":
+        # The T and C histories of the Colless recurrence, one chunk of rows,
+        # and the write buffers of the n column and three files per bigint column.
+        history = sum(2 * (int_bytes(predicted_bits("C", n)) + _LIST_SLOT)
+                      for n in range(1, n_max + 1))
+        chunk = _STREAM_CHUNK * sum(int_bytes(predicted_bits(name, n_max)) + _LIST_SLOT
+                                    for name in NAMES)
+        buffers = (1 + 3 * len(NAMES)) * io.DEFAULT_BUFFER_SIZE
+        return history + chunk + buffers + _STREAM_OVERHEAD
+    if kind in INVARIANTS:
+        _, k_max = INVARIANTS[kind]
+        # A count in row n is at most T(n) < 4^(n-1).
+        return sum((k_max(n) - _k_min(kind, n) + 1) * (_DICT_ENTRY + int_bytes(2 * n))
+                   for n in range(1, n_max + 1))
+    if kind == "shapes":
+        return sum(math.comb(2 * k, k) // (k + 1) for k in range(1, n_max + 1)) * _SHAPE
+    raise ValueError(f"Unknown kind {kind!r}.")
+
+
+def measure_peak(function, *args, **kwargs):
+    """(result, peak traced bytes) of one call."""
+    tracemalloc.start()
+    try:
+        result = function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+class MemoryBudget:
+    """A limit in bytes and the choice of build mode it implies."""
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def fits(self, kind, n_max):
+        return estimate_bytes(kind, n_max) <= self.limit
+
+    def plan(self, kind, n_max):
+        """
+        'memory' when the build fits, else 'spill' (tables) or 'stream'.
+        Streamed totals still hold the Colless history; MemoryError when even
+        that exceeds the limit.
+        """
+        if self.fits(kind, n_max):
+            return "memory"
+        if kind in INVARIANTS:
+            return "spill"
+        if kind == "totals" and not self.fits("totals_stream", n_max):
+            raise MemoryError(f"Totals up to n = {n_max} need about "
+                              f"{estimate_bytes('totals_stream', n_max)} bytes even when streamed; "
+                              f"the budget is {self.limit}.")
+        return "stream"
+
+
+# -----------------------------------------------------------------------------
+# Builders
+# -----------------------------------------------------------------------------
+
+def build_totals(n_max, budget, directory=None):
+    """
+    Totals T, S, C, Phi, X, S2 for n <= n_max.  Returns the lists of
+    fastpath.compute_invariants_fast when they fit the budget, otherwise a
+    columnar.ColumnarTable streamed to directory (a new temporary directory
+    by default) with one row per n; raises MemoryError when neither fits.
+    """
+    if budget.plan("totals", n_max) == "memory":
+        from fastpath import compute_invariants_fast
+        return compute_invariants_fast(n_max)
+    from columnar import ColumnarTable, ColumnarWriter
+    directory = directory or tempfile.mkdtemp(prefix="totals")
+    schema = [("n", "int64")] + [(name, "bigint") for name in NAMES]
+    with ColumnarWriter(directory, schema, chunk_rows=_STREAM_CHUNK) as writer:
+        for row in closed_form_rows(n_max):
+            writer.append(**dict(zip(("n",) + NAMES, row)))
+    return ColumnarTable(directory)
+
+
+def build_distribution(invariant, n_max, budget, directory=None):
+    """
+    Bivariate table of an invariant: the in-memory list of tiledp when it fits
+    the budget, otherwise a TiledDistribution built on disk whose tile cache
+    uses at most half the budget.
+    """
+    from tiledp import TiledDistribution, in_memory_distribution
+    if budget.plan(invariant, n_max) == "memory":
+        return in_memory_distribution(invariant, n_max)
+    directory = directory or tempfile.mkdtemp(prefix=invariant)
+    table = TiledDistribution(directory, invariant, ram_budget=budget.limit // 2)
+    table.build(n_max)
+    return table
+
+
+def cherry_distribution_bruteforce(n_internal, budget):
+    """
+    Cherry counts {k: trees} over all shapes with n_internal internal nodes by
+    enumeration: cherry.py's memo while it fits, else Dyck-word blocks.
+    """
+    from collections import Counter
+    if budget.plan("shapes", n_internal) == "memory":
+        from cherry import count_cherries, generate_full_binary_trees
+        return dict(Counter(count_cherries(s) for s in generate_full_binary_trees(n_internal, {})))
+    from dyckenum import block_invariants, word_blocks
+    n = n_internal + 1
+    # A block row costs about 2n bytes of word and 3 (n + 1) int64 stack cells.
+    block = max(1, budget.limit // (2 * n + 24 * (n + 1) + 64))
+    counts = Counter()
+    for _, words in word_blocks(n, block):
+        counts.update(block_invariants(words, n)["X"].tolist())
+    return dict(counts)
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+    def test_model_tracks_tracemalloc(self):
+        from cherry import generate_full_binary_trees
+        from fastpath import compute_invariants_fast
+        from tiledp import in_memory_distribution
+        cases = [("totals", 400, compute_invariants_fast, (400,)),
+                 ("sackin", 25, in_memory_distribution, ("sackin", 25)),
+                 ("shapes", 10, generate_full_binary_trees, (10, {}))]
+        for kind, n, function, args in cases:
+            _, peak = measure_peak(function, *args)
+            estimate = estimate_bytes(kind, n)
+            self.assertLess(estimate / peak, 2, kind)
+            self.assertGreater(estimate / peak, 1 / 2, kind)
+
+    def test_totals_stream_when_over_budget(self):
+        import columnar  # noqa: F401  (module import is not part of the build)
+        from fastpath import compute_invariants_fast
+        N = 600
+        expected = compute_invariants_fast(N)
+        self.assertIs(type(build_totals(N, MemoryBudget(1 << 30))), tuple)
+        small = MemoryBudget(estimate_bytes("totals_stream", N))
+        self.assertLess(small.limit, estimate_bytes("totals", N))
+        self.assertEqual(small.plan("totals", N), "stream")
+        with tempfile.TemporaryDirectory() as tmp:
+            table, peak = measure_peak(build_totals, N, small, tmp)
+            self.assertLessEqual(peak, small.limit)
+            for name, seq in zip(NAMES, expected):
+                self.assertEqual(table.values(name), seq[1:])
+        with self.assertRaises(MemoryError):
+            build_totals(N, MemoryBudget(small.limit // 2))
+
+    def test_distribution_spill_and_bruteforce_stream(self):
+        from cherry import build_cherry_coeff_table
+        from tiledp import in_memory_distribution
+        N = 14
+        budget = MemoryBudget(estimate_bytes("colless", N) // 10)
+        with tempfile.TemporaryDirectory() as tmp:
+            table = build_distribution("colless", N, budget, tmp)
+            self.assertEqual(table.ram_budget, budget.limit // 2)
+            self.assertEqual(table.row(N), in_memory_distribution("colless", N)[N])
+        self.assertIsInstance(build_distribution("colless", N, MemoryBudget(1 << 30)), list)
+        expected = {k: v for k, v in build_cherry_coeff_table(9)[9].items() if v}
+        self.assertEqual(cherry_distribution_bruteforce(9, MemoryBudget(1 << 30)), expected)
+        tight = MemoryBudget(estimate_bytes("shapes", 9) // 100)
+        self.assertEqual(tight.plan("shapes", 9), "stream")
+        self.assertEqual(cherry_distribution_bruteforce(9, tight), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
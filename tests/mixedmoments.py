@@ -0,0 +1,196 @@
+"""
+Exact Mixed Moments and Covariance Matrices of the Invariants
+
+readme.md section 8.2 asks for the joint behaviour of (S, C) and (S, Phi); for
+multivariate tests the second-order structure is enough.  For the invariants
+I = (S, C, Phi, X, S2) of a tree with root split (i, j = n - i),
+    I = L I_l + L I_r + f(n, i),
+where f holds the root terms (n, |2i - n|, binom(i, 2) + binom(j, 2), [n == 2],
+n) and L is the identity except for S2 = S2_l + S2_r + 2 (S_l + S_r) + n.
+Summing over all T(i) T(j) trees of a split, the totals A(n) = sum I and the
+mixed totals B(n) = sum I I^T (a 5 x 5 integer matrix) satisfy
+    A(n) = sum_i 2 L A(i) T(j) + f T(i) T(j)
+    B(n) = sum_i 2 L B(i) L^T T(j) + 2 L A(i) A(j)^T L^T
+                 + f G(i)^T + G(i) f^T + f f^T T(i) T(j),
+    G(i) = L A(i) T(j) + L A(j) T(i),
+using the symmetry i <-> j for the first two terms.  Each row is a handful
+of dot products over object arrays of Python ints, O(n) per row and O(n^2)
+overall, exactly as in fastpath.py.  Covariances then follow in exact
+rationals (uniform model):
+    Cov(I_a, I_b) = B_ab / T - A_a A_b / T^2.
+
+The integer tables are cached in memory and extended on demand, and
+export_moments writes them next to the totals as a bigtable.py file.
+"""
+
+import math
+import unittest
+from fractions import Fraction
+
+import numpy as np
+
+INVARIANTS = ("S", "C", "Phi", "X", "S2")
+_S, _S2 = INVARIANTS.index("S"), INVARIANTS.index("S2")
+
+# L maps subtree invariants to their contribution at the parent.
+_L = np.identity(len(INVARIANTS), dtype=int).astype(object)
+_L[_S2, _S] = 2
+
+
+class _Cache:
+    """Integer tables T, A, B for n <= N, grown in place."""
+
+    def __init__(self):
+        self.T = [0, 1]
+        self.A = [None, np.zeros(len(INVARIANTS), dtype=int).astype(object)]
+        self.B = [None, np.zeros((len(INVARIANTS),) * 2, dtype=int).astype(object)]
+
+    @property
+    def N(self):
+        return len(self.T) - 1
+
+    def extend(self, N):
+        T, A, B = self.T, self.A, self.B
+        for n in range(self.N + 1, N + 1):
+            i = np.arange(1, n).astype(object)
+            j = n - i
+            T_fwd = np.array(T[1:n], dtype=object)
+            T_rev = T_fwd[::-1]
+            pairs = T_fwd * T_rev
+            F = np.empty((n - 1, len(INVARIANTS)), dtype=object)
+            F[:, 0] = n
+            F[:, 1] = abs(2 * i - n)
+            F[:, 2] = i * (i - 1) // 2 + j * (j - 1) // 2
+            F[:, 3] = 1 if n == 2 else 0
+            F[:, 4] = n
+            LA = np.array(A[1:n], dtype=object).dot(_L.T)
+            LA_rev = LA[::-1]
+            LBL = [_L.dot(b).dot(_L.T) for b in B[1:n]]
+
+            T.append(int(pairs.sum()))
+            A.append(2 * T_rev.dot(LA) + pairs.dot(F))
+            G = LA * T_rev[:, None] + LA_rev * T_fwd[:, None]
+            H = F.T.dot(G)
+            within = sum(t * b for t, b in zip(T_rev, LBL))
+            B.append(2 * within + 2 * LA.T.dot(LA_rev) + H + H.T
+                     + (F * pairs[:, None]).T.dot(F))
+
+
+_CACHE = _Cache()
+
+
+def mixed_totals(N):
+    """
+    Exact integer tables for 1 <= n <= N (uniform model): T(n), the totals
+    A(n)[a] = sum I_a and the mixed totals B(n)[a][b] = sum I_a I_b over all
+    T(n) trees, invariants ordered as INVARIANTS.  Returns (T, A, B), lists
+    indexed by n (A and B as nested lists of ints).
+    """
+    _CACHE.extend(N)
+    return (_CACHE.T[:N + 1],
+            [None] + [a.tolist() for a in _CACHE.A[1:N + 1]],
+            [None] + [b.tolist() for b in _CACHE.B[1:N + 1]])
+
+
+def covariance_matrix(n):
+    """Exact covariance matrix of INVARIANTS at n leaves, as Fractions."""
+    _CACHE.extend(n)
+    T, A, B = _CACHE.T[n], _CACHE.A[n], _CACHE.B[n]
+    size = len(INVARIANTS)
+    return [[Fraction(B[a][b], T) - Fraction(A[a] * A[b], T * T) for b in range(size)]
+            for a in range(size)]
+
+
+def correlation_matrix(n):
+    """
+    Correlation matrix of INVARIANTS at n leaves as floats; entries involving
+    an invariant with zero variance (constant at this n) are NaN.
+    """
+    cov = covariance_matrix(n)
+    size = len(cov)
+    out = [[math.nan] * size for _ in range(size)]
+    for a in range(size):
+        for b in range(size):
+            if cov[a][a] and cov[b][b]:
+                # Take the square root of the exact ratio to avoid float overflow.
+                r = math.sqrt(cov[a][b] ** 2 / (cov[a][a] * cov[b][b]))
+                out[a][b] = math.copysign(r, cov[a][b])
+    return out
+
+
+def export_moments(path, N):
+    """
+    Write T, the totals and the upper triangle of the mixed totals for
+    n = 0..N to a bigtable.py file; mixed columns are named e.g. "S*Phi".
+    """
+    from bigtable import write_bigtable
+    T, A, B = mixed_totals(N)
+    columns = {"T": [0] + T[1:]}
+    for a, name in enumerate(INVARIANTS):
+        columns[name] = [0] + [row[a] for row in A[1:]]
+    for a, name_a in enumerate(INVARIANTS):
+        for b in range(a, len(INVARIANTS)):
+            columns[f"{name_a}*{INVARIANTS[b]}"] = [0] + [row[a][b] for row in B[1:]]
+    write_bigtable(path, columns)
+
+
+class TestMixedMoments(unittest.TestCase):
+
+    def test_matches_enumeration(self):
+        from ntest2 import generate_trees
+
+        def invariants(tree):
+            """(leaves, S, C, Phi, X, S2) of a nested-tuple tree."""
+            if tree == "L":
+                return 1, 0, 0, 0, 0, 0
+            l, r = invariants(tree[0]), invariants(tree[1])
+            n = l[0] + r[0]
+            return (n, l[1] + r[1] + n, l[2] + r[2] + abs(l[0] - r[0]),
+                    l[3] + r[3] + l[0] * (l[0] - 1) // 2 + r[0] * (r[0] - 1) // 2,
+                    l[4] + r[4] + (n == 2), l[5] + r[5] + 2 * (l[1] + r[1]) + n)
+
+        T, A, B = mixed_totals(9)
+        for n in range(1, 10):
+            values = [invariants(t)[1:] for t in generate_trees(n)]
+            self.assertEqual(T[n], len(values))
+            self.assertEqual(A[n], [sum(v[a] for v in values) for a in range(5)])
+            self.assertEqual(B[n], [[sum(v[a] * v[b] for v in values) for b in range(5)]
+                                    for a in range(5)])
+
+    def test_totals_and_variances(self):
+        from fastpath import NAMES, compute_invariants_fast
+        from splitmodels import invariant_moments
+        N = 60
+        totals = dict(zip(NAMES, compute_invariants_fast(N)))
+        T, A, _ = mixed_totals(N)
+        _, var = invariant_moments(N, exact=True)
+        for n in range(1, N + 1):
+            self.assertEqual(T[n], totals["T"][n])
+            self.assertEqual(A[n], [totals[k][n] for k in INVARIANTS])
+            cov = covariance_matrix(n)
+            self.assertEqual([cov[a][a] for a in range(5)], [var[k][n] for k in INVARIANTS])
+            self.assertEqual(cov, [list(row) for row in zip(*cov)])
+
+    def test_correlations_and_export(self):
+        import os
+        import tempfile
+        from bigtable import BigTable
+        corr = correlation_matrix(200)
+        for a in range(5):
+            self.assertAlmostEqual(corr[a][a], 1.0)
+            for b in range(5):
+                self.assertLessEqual(abs(corr[a][b]), 1.0 + 1e-12)
+        # Sackin and Sackin2 are nearly collinear, cherries almost independent.
+        self.assertGreater(corr[_S][_S2], 0.9)
+        self.assertTrue(math.isnan(correlation_matrix(2)[1][1]))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "moments.bin")
+            export_moments(path, 30)
+            _, A, B = mixed_totals(30)
+            with BigTable(path) as table:
+                self.assertEqual(table.value("S*Phi", 30), B[30][_S][2])
+                self.assertEqual(table.value("X", 30), A[30][3])
+
+
+if __name__ == '__main__':
+    unittest.main()
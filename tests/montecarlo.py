@@ -0,0 +1,181 @@
+"""
+Reproducible Parallel Monte Carlo over Random Trees
+
+test5.py and the samplers draw from the global random module, so runs can be
+neither split across processes nor repeated.  This runner fixes both:
+
+  - The trees are cut into batches of a fixed size, independent of the number
+    of workers.  Batch b draws from its own numpy Generator seeded by child b
+    of numpy.random.SeedSequence(seed).spawn(...), so every tree depends only
+    on (seed, batch size, its index) and the merged result is bit-identical
+    for any worker count, including the in-process run with workers=1.
+  - Batches are evaluated on a process pool.  Only the batch index crosses
+    the process boundary: the workers attach to shared-memory buffers by name
+    and write the invariant values (and, on request, the tree arrays) of each
+    tree straight into its row, so no tree or result is pickled and merging
+    is just the row order.
+
+Trees are drawn with splitmodels.random_tree (any split model spec: "pda",
+"yule" or a beta-splitting parameter) and scored with tree_invariants.
+"""
+
+import os
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from treearray import LEAF, leaves_below, node_depths
+
+INVARIANTS = ("S", "C", "Phi", "X", "S2")
+
+
+def tree_invariants(left, right):
+    """(S, C, Phi, X, S2) of an encoded tree, in one pass over its nodes."""
+    size = leaves_below(left, right)
+    depth = node_depths(left, right)
+    S = C = Phi = X = S2 = 0
+    root = len(left) - 1
+    for v in range(len(left)):
+        l = left[v]
+        if l == LEAF:
+            d = depth[v]
+            S += d
+            S2 += d * d
+            continue
+        r = right[v]
+        C += abs(size[l] - size[r])
+        if v != root:
+            Phi += size[v] * (size[v] - 1) // 2
+        if left[l] == LEAF and left[r] == LEAF:
+            X += 1
+    return S, C, Phi, X, S2
+
+
+def _model(spec):
+    from splitmodels import beta_splitting, pda, yule
+    if spec is None or spec == "pda":
+        return pda()
+    if spec == "yule":
+        return yule()
+    return beta_splitting(float(spec))
+
+
+# -----------------------------------------------------------------------------
+# Workers
+# -----------------------------------------------------------------------------
+
+_STATE = {}
+
+
+def _attach(names, n, trees, batch, seed, model):
+    """Pool initializer: map the shared buffers and build the batch seeds."""
+    import numpy as np
+    blocks = {key: shared_memory.SharedMemory(name=name) for key, name in names.items()}
+    nodes = 2 * n - 1
+    arrays = {"values": np.ndarray((trees, len(INVARIANTS)), dtype=np.int64,
+                                   buffer=blocks["values"].buf)}
+    for key in ("left", "right"):
+        if key in blocks:
+            arrays[key] = np.ndarray((trees, nodes), dtype=np.int32, buffer=blocks[key].buf)
+    batches = -(-trees // batch)
+    _STATE.update(blocks=blocks, arrays=arrays, n=n, trees=trees, batch=batch,
+                  seeds=np.random.SeedSequence(seed).spawn(batches), model=_model(model))
+
+
+def _run_batch(b):
+    """Draw and score batch b into its rows of the shared buffers."""
+    import numpy as np
+    from splitmodels import random_tree
+    s = _STATE
+    rng = np.random.default_rng(s["seeds"][b])
+    arrays = s["arrays"]
+    for t in range(b * s["batch"], min((b + 1) * s["batch"], s["trees"])):
+        left, right = random_tree(s["n"], s["model"], rng)
+        arrays["values"][t] = tree_invariants(left, right)
+        if "left" in arrays:
+            arrays["left"][t] = left
+            arrays["right"][t] = right
+    return b
+
+
+def _detach():
+    for block in _STATE.pop("blocks", {}).values():
+        block.close()
+    _STATE.clear()
+
+
+def monte_carlo(n, trees, seed=0, model="pda", workers=None, batch=256, keep_trees=False):
+    """
+    Draw `trees` random trees with n leaves and score them.  Returns a dict
+    with "values" (int64 array, one row of INVARIANTS per tree) and, with
+    keep_trees=True, the int32 arrays "left" and "right" of shape
+    (trees, 2n - 1).  The result depends on (n, trees, seed, model, batch)
+    only; workers defaults to os.cpu_count().
+    """
+    import numpy as np
+    workers = workers or os.cpu_count() or 1
+    shapes = {"values": (trees, len(INVARIANTS), np.int64)}
+    if keep_trees:
+        shapes["left"] = shapes["right"] = (trees, 2 * n - 1, np.int32)
+    blocks = {key: shared_memory.SharedMemory(create=True,
+                                              size=max(1, rows * cols * np.dtype(dt).itemsize))
+              for key, (rows, cols, dt) in shapes.items()}
+    try:
+        names = {key: block.name for key, block in blocks.items()}
+        args = (names, n, trees, batch, seed, model)
+        batches = range(-(-trees // batch))
+        if workers == 1:
+            _attach(*args)
+            try:
+                for b in batches:
+                    _run_batch(b)
+            finally:
+                _detach()
+        else:
+            with ProcessPoolExecutor(workers, initializer=_attach, initargs=args) as pool:
+                for _ in pool.map(_run_batch, batches):
+                    pass
+        return {key: np.ndarray((rows, cols), dtype=dt, buffer=blocks[key].buf).copy()
+                for key, (rows, cols, dt) in shapes.items()}
+    finally:
+        for block in blocks.values():
+            block.close()
+            block.unlink()
+
+
+class TestMonteCarlo(unittest.TestCase):
+
+    def test_invariants_match_recurrence(self):
+        from fastpath import compute_invariants_fast
+        from ntest2 import generate_trees
+        from treearray import from_nested
+        _, S, C, Phi, X, S2 = compute_invariants_fast(8)
+        for n in range(1, 9):
+            trees = [from_nested(t) for t in generate_trees(n)]
+            totals = [sum(tree_invariants(*t)[a] for t in trees) for a in range(5)]
+            self.assertEqual(totals, [S[n], C[n], Phi[n], X[n], S2[n]])
+
+    def test_independent_of_worker_count(self):
+        import numpy as np
+        serial = monte_carlo(40, 300, seed=42, workers=1, batch=32, keep_trees=True)
+        parallel = monte_carlo(40, 300, seed=42, workers=3, batch=32, keep_trees=True)
+        for key in ("values", "left", "right"):
+            np.testing.assert_array_equal(serial[key], parallel[key])
+        other = monte_carlo(40, 300, seed=43, workers=1, batch=32)
+        self.assertFalse(np.array_equal(serial["values"], other["values"]))
+        for t in (0, 299):
+            left, right = serial["left"][t].tolist(), serial["right"][t].tolist()
+            self.assertEqual(tuple(serial["values"][t]), tree_invariants(left, right))
+
+    def test_means(self):
+        from splitmodels import invariant_moments
+        n, trees = 30, 4000
+        result = monte_carlo(n, trees, seed=1, model="yule", workers=2)
+        mean, var = invariant_moments(n, _model("yule"))
+        for a, name in enumerate(INVARIANTS):
+            sample = result["values"][:, a]
+            self.assertLess(abs(sample.mean() - mean[name][n]), 5 * (var[name][n] / trees) ** 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
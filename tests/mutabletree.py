@@ -0,0 +1,388 @@
+"""
+Mutable Trees with Incrementally Maintained Invariants
+
+MCMC samplers propose millions of local rearrangements and need balance
+statistics after each; recomputing sackin_index, colless_index and
+count_cherries (test1.py, cherry.py) costs O(n) per proposal.  MutableTree
+keeps a tree in flat lists (left, right, parent, size = leaves below) indexed
+by stable node ids, and supports NNI, SPR and leaf insertion/deletion.
+
+All four invariants are sums of per-node terms that depend only on the sizes
+of a node and its children:
+    S   = sum over internal v of size(v)              (each leaf once per ancestor)
+    C   = sum over internal v of |size(l) - size(r)|
+    Phi = sum over internal v != root of binom(size(v), 2)
+    X   = number of internal v whose children are both leaves.
+An edit changes sizes only on the root paths of the nodes it touches, so each
+operation subtracts the terms of those paths, rewires, and adds them back, in
+time proportional to the depth of the affected nodes rather than to n.  Node
+depths are not stored (an SPR would change the depth of a whole subtree);
+depth(v) walks the parent pointers instead.
+
+Every write is journaled, and undo() restores the previous state of the last
+operations (a bounded history, as needed to reject MCMC proposals).
+"""
+
+import random
+import unittest
+from collections import deque
+
+from treearray import LEAF, leaves_below
+
+INVARIANTS = ("S", "C", "Phi", "X")
+
+
+class MutableTree:
+    """
+    Array-backed mutable tree built from post-order arrays (treearray.py).
+    Node ids are stable across edits; removed ids are recycled.
+    """
+
+    def __init__(self, left, right, history=16):
+        m = len(left)
+        self.left = list(left)
+        self.right = list(right)
+        self.parent = [LEAF] * m
+        for v in range(m):
+            if self.left[v] != LEAF:
+                self.parent[self.left[v]] = v
+                self.parent[self.right[v]] = v
+        self.size = list(leaves_below(left, right))
+        self.root = m - 1
+        self._free = []
+        self._journal = None
+        self._history = deque(maxlen=history)
+        self.totals = [0] * len(INVARIANTS)
+        self._apply(range(m), 1)
+
+    @classmethod
+    def from_nested(cls, tree, history=16):
+        from treearray import from_nested
+        return cls(*from_nested(tree), history=history)
+
+    # -------------------------------------------------------------------------
+    # Queries
+    # -------------------------------------------------------------------------
+
+    def invariants(self):
+        """Current values as a dict keyed by INVARIANTS."""
+        return dict(zip(INVARIANTS, self.totals))
+
+    def is_leaf(self, v):
+        return self.left[v] == LEAF
+
+    def num_leaves(self):
+        return self.size[self.root]
+
+    def depth(self, v):
+        """Depth of node v (the root has depth 0), in O(depth)."""
+        d = 0
+        while self.parent[v] != LEAF:
+            v = self.parent[v]
+            d += 1
+        return d
+
+    def leaves(self):
+        """Ids of all leaves."""
+        free = set(self._free)
+        return [v for v in range(len(self.left))
+                if self.left[v] == LEAF and v not in free and self.size[v]]
+
+    def internal_nodes(self):
+        """Ids of all internal nodes."""
+        return [v for v in range(len(self.left)) if self.left[v] != LEAF]
+
+    def to_arrays(self):
+        """Post-order (left, right) lists of the current tree, with fresh ids."""
+        left = []
+        right = []
+        emitted = []
+        stack = [(self.root, False)]
+        while stack:
+            v, expanded = stack.pop()
+            if self.left[v] == LEAF:
+                left.append(LEAF)
+                right.append(LEAF)
+                emitted.append(len(left) - 1)
+            elif expanded:
+                r = emitted.pop()
+                l = emitted.pop()
+                left.append(l)
+                right.append(r)
+                emitted.append(len(left) - 1)
+            else:
+                stack.append((v, True))
+                stack.append((self.right[v], False))
+                stack.append((self.left[v], False))
+        return left, right
+
+    # -------------------------------------------------------------------------
+    # Bookkeeping
+    # -------------------------------------------------------------------------
+
+    def _terms(self, v):
+        l = self.left[v]
+        if l == LEAF:
+            return 0, 0, 0, 0
+        r = self.right[v]
+        s = self.size[v]
+        return (s, abs(self.size[l] - self.size[r]),
+                s * (s - 1) // 2 if v != self.root else 0,
+                1 if self.left[l] == LEAF and self.left[r] == LEAF else 0)
+
+    def _apply(self, nodes, sign):
+        for v in nodes:
+            for a, t in enumerate(self._terms(v)):
+                self.totals[a] += sign * t
+
+    def _path(self, v):
+        """v and all of its ancestors."""
+        out = [v]
+        while self.parent[out[-1]] != LEAF:
+            out.append(self.parent[out[-1]])
+        return out
+
+    def _set(self, name, v, value):
+        arr = getattr(self, name)
+        self._journal.append(("set", name, v, arr[v]))
+        arr[v] = value
+
+    def _begin(self, affected):
+        self._journal = []
+        self._history.append((self._journal, self.root, list(self.totals)))
+        self._apply(affected, -1)
+
+    def _end(self, affected):
+        self._apply(affected, 1)
+        self._journal = None
+
+    def _set_root(self, v):
+        self._journal.append(("root", self.root))
+        self.root = v
+
+    def _alloc(self):
+        if self._free:
+            v = self._free.pop()
+            self._journal.append(("alloc", v))
+        else:
+            for arr in (self.left, self.right, self.parent):
+                arr.append(LEAF)
+            self.size.append(0)
+            v = len(self.left) - 1
+            self._journal.append(("grow",))
+        return v
+
+    def _release(self, v):
+        self._set("left", v, LEAF)
+        self._set("right", v, LEAF)
+        self._set("parent", v, LEAF)
+        self._set("size", v, 0)
+        self._free.append(v)
+        self._journal.append(("free", v))
+
+    def _replace_child(self, p, old, new):
+        """Put `new` where `old` hangs (under p, or at the root if p is LEAF)."""
+        if p == LEAF:
+            self._set_root(new)
+        elif self.left[p] == old:
+            self._set("left", p, new)
+        else:
+            self._set("right", p, new)
+        self._set("parent", new, p)
+
+    def _add_size(self, v, delta):
+        while v != LEAF:
+            self._set("size", v, self.size[v] + delta)
+            v = self.parent[v]
+
+    def _sibling(self, v):
+        p = self.parent[v]
+        return self.right[p] if self.left[p] == v else self.left[p]
+
+    def undo(self):
+        """Revert the most recent operation still in the history."""
+        if not self._history:
+            raise ValueError("Nothing to undo.")
+        journal, root, totals = self._history.pop()
+        for entry in reversed(journal):
+            kind = entry[0]
+            if kind == "set":
+                getattr(self, entry[1])[entry[2]] = entry[3]
+            elif kind == "grow":
+                for arr in (self.left, self.right, self.parent, self.size):
+                    arr.pop()
+            elif kind == "alloc":
+                self._free.append(entry[1])
+            elif kind == "free":
+                self._free.pop()
+        self.root = root
+        self.totals = totals
+
+    # -------------------------------------------------------------------------
+    # Edits
+    # -------------------------------------------------------------------------
+
+    def nni(self, v, side=0):
+        """
+        Nearest-neighbour interchange across the edge above internal node v:
+        swap v's left (side=0) or right (side=1) child with v's sibling.
+        """
+        if self.left[v] == LEAF or v == self.root:
+            raise ValueError("NNI needs an internal node other than the root.")
+        p = self.parent[v]
+        w = self._sibling(v)
+        c = self.left[v] if side == 0 else self.right[v]
+        affected = [v, p]
+        self._begin(affected)
+        self._set("left" if side == 0 else "right", v, w)
+        self._set("parent", w, v)
+        self._set("left" if self.left[p] == w else "right", p, c)
+        self._set("parent", c, p)
+        self._set("size", v, self.size[v] - self.size[c] + self.size[w])
+        self._end(affected)
+
+    def spr(self, u, target):
+        """
+        Subtree prune and regraft: detach the subtree at u (with its parent
+        node) and reattach it on the edge above target.
+        """
+        if u == self.root:
+            raise ValueError("Cannot prune the root.")
+        p = self.parent[u]
+        target_path = self._path(target)
+        if u in target_path or target == p:
+            raise ValueError("target must lie outside the pruned subtree.")
+        s = self._sibling(u)
+        affected = set(self._path(p)) | set(target_path) | {s}
+        self._begin(affected)
+        u_is_left = self.left[p] == u
+        self._add_size(self.parent[p], -self.size[u])
+        self._replace_child(self.parent[p], p, s)
+        t_parent = self.parent[target]
+        self._replace_child(t_parent, target, p)
+        self._set("left", p, u if u_is_left else target)
+        self._set("right", p, target if u_is_left else u)
+        self._set("parent", target, p)
+        self._set("size", p, self.size[target] + self.size[u])
+        self._add_size(t_parent, self.size[u])
+        self._end(affected)
+
+    def insert_leaf(self, target):
+        """Attach a new leaf on the edge above target; returns its id."""
+        path = self._path(target)
+        self._begin(path)
+        p = self._alloc()
+        x = self._alloc()
+        self._set("size", x, 1)
+        self._replace_child(self.parent[target], target, p)
+        self._set("left", p, target)
+        self._set("right", p, x)
+        self._set("parent", target, p)
+        self._set("parent", x, p)
+        self._set("size", p, self.size[target])
+        self._add_size(p, 1)
+        self._end(path + [p])
+        return x
+
+    def delete_leaf(self, x):
+        """Remove leaf x together with its parent node."""
+        if self.left[x] != LEAF or x == self.root:
+            raise ValueError("Can only delete a leaf of a tree with two or more leaves.")
+        p = self.parent[x]
+        s = self._sibling(x)
+        affected = self._path(p) + [s]
+        self._begin(affected)
+        self._add_size(self.parent[p], -1)
+        self._replace_child(self.parent[p], p, s)
+        self._release(x)
+        self._release(p)
+        self._end(affected)
+
+
+class TestMutableTree(unittest.TestCase):
+
+    def check(self, tree):
+        from montecarlo import tree_invariants
+        left, right = tree.to_arrays()
+        self.assertEqual(tuple(tree.totals), tree_invariants(left, right)[:4])
+        self.assertEqual(tree.num_leaves(), (len(left) + 1) // 2)
+
+    def random_edit(self, tree, rng):
+        internal = [v for v in tree.internal_nodes() if v != tree.root]
+        nodes = [v for v in range(len(tree.left))
+                 if v not in tree._free and (tree.parent[v] != LEAF or v == tree.root)]
+        move = rng.randrange(4)
+        if move == 0 and internal:
+            tree.nni(rng.choice(internal), rng.randrange(2))
+        elif move == 1:
+            u = rng.choice([v for v in nodes if v != tree.root] or [None])
+            if u is None:
+                return False
+            blocked = set()
+            stack = [u]
+            while stack:
+                v = stack.pop()
+                blocked.add(v)
+                if tree.left[v] != LEAF:
+                    stack += [tree.left[v], tree.right[v]]
+            candidates = [v for v in nodes if v not in blocked and v != tree.parent[u]]
+            if not candidates:
+                return False
+            tree.spr(u, rng.choice(candidates))
+        elif move == 2:
+            tree.insert_leaf(rng.choice(nodes))
+        else:
+            leaves = [v for v in tree.leaves() if v != tree.root]
+            if not leaves:
+                return False
+            tree.delete_leaf(rng.choice(leaves))
+        return True
+
+    def test_random_edits_and_undo(self):
+        from splitmodels import random_tree
+        rng = random.Random(4)
+        tree = MutableTree(*random_tree(30, rng=rng), history=3)
+        self.check(tree)
+        for _ in range(500):
+            before = (tree.to_arrays(), list(tree.totals), tree.num_leaves())
+            if not self.random_edit(tree, rng):
+                continue
+            self.check(tree)
+            if rng.random() < 0.3:
+                tree.undo()
+                self.assertEqual((tree.to_arrays(), list(tree.totals), tree.num_leaves()), before)
+
+    def test_multi_step_undo_and_depth(self):
+        tree = MutableTree.from_nested((("L", "L"), ("L", ("L", "L"))))
+        state = (list(tree.left), list(tree.right), list(tree.parent), list(tree.size), tree.root)
+        x = tree.insert_leaf(tree.root)
+        self.assertEqual(tree.depth(x), 1)
+        self.assertEqual(tree.num_leaves(), 6)
+        tree.delete_leaf(0)
+        tree.nni(next(v for v in tree.internal_nodes() if v != tree.root))
+        self.check(tree)
+        for _ in range(3):
+            tree.undo()
+        self.assertEqual((tree.left, tree.right, tree.parent, tree.size, tree.root), state)
+        with self.assertRaises(ValueError):
+            tree.undo()
+        with self.assertRaises(ValueError):
+            tree.spr(tree.root, 0)
+
+    def test_path_cost(self):
+        from boltzmann import boltzmann_tree
+        import numpy as np
+        left, right = boltzmann_tree(20000, rng=np.random.default_rng(5))
+        tree = MutableTree(left.tolist(), right.tolist())
+        rng = random.Random(9)
+        for _ in range(200):
+            leaf = rng.choice(range(len(left)))
+            if tree.left[leaf] == LEAF and leaf != tree.root:
+                x = tree.insert_leaf(leaf)
+                self.assertLessEqual(len(tree._history[-1][0]), 16 + 4 * tree.depth(x))
+                tree.undo()
+        self.check(tree)
+
+
+if __name__ == '__main__':
+    unittest.main()
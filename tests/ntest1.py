@@ -1,5 +1,7 @@
 import math
 
+from bigtable import format_value
+
 # Set maximum number of leaves
 N = 100
 
@@ -61,10 +63,11 @@ for n in range(3, N + 1):
 # Print a table of results for n from 1 to N
 print("n\tT(n)\t\tS(n)\t\tC(n)\t\tPhi(n)\t\tX(n)")
 for n in range(1, N + 1):
-    # Use scientific notation for very long integers if needed
-    T_str = str(T[n]) if len(str(T[n])) < 35 else f"{T[n]:.5e}"
-    S_str = str(S[n]) if len(str(S[n])) < 35 else f"{S[n]:.5e}"
-    C_str = str(C[n]) if len(str(C[n])) < 35 else f"{C[n]:.5e}"
-    Phi_str = str(Phi[n]) if len(str(Phi[n])) < 35 else f"{Phi[n]:.5e}"
+    # Use scientific notation for very long integers if needed; format_value
+    # decides from the magnitude and never converts long integers to decimal.
+    T_str = format_value(T[n])
+    S_str = format_value(S[n])
+    C_str = format_value(C[n])
+    Phi_str = format_value(Phi[n])
     X_str = str(X[n])
     print(f"{n}\t{T_str}\t{S_str}\t{C_str}\t{Phi_str}\t{X_str}")
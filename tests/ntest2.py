@@ -22,8 +22,6 @@ import math
 import time
 import unittest
 import statistics
-import numpy as np
-from sympy import symbols, series, sqrt
 
 # ------------------------------
 # 1. Dynamic Programming Routines for T, S, C, Phi, X
@@ -228,6 +226,7 @@ class TestAllInvariants(unittest.TestCase):
 
     def test_symbolic_series_catalan(self):
         # Expand the generating function G(x) = (1 - sqrt(1-4*x)) / 2 and compare coefficients.
+        from sympy import symbols, series, sqrt
         x = symbols('x')
         G = (1 - sqrt(1 - 4*x)) / 2
         G_series = series(G, x, 0, 12).removeO()
@@ -246,6 +245,7 @@ class TestAllInvariants(unittest.TestCase):
 
     def test_runtime_scaling(self):
         # Measure runtime for computing S(n) for various n, average over 5 runs, and perform log-log regression.
+        import numpy as np
         sample_ns = [50, 75, 100, 125, 150]
         avg_times = []
         num_runs = 5
@@ -1,6 +1,4 @@
 import math
-import sympy as sp
-import pandas as pd
 
 # Disable logging for raw output.
 import logging
@@ -62,6 +60,7 @@ def compute_invariants(n_max):
 # Closed-form generating function series expansion.
 # ---------------------------
 def series_coefficients(expr, n_max):
+    import sympy as sp
     x = sp.symbols('x')
     poly = sp.series(expr, x, 0, n_max + 1).removeO()
     coeffs = [sp.expand(poly).coeff(x, n) for n in range(n_max + 1)]
@@ -77,6 +76,8 @@ def catalan(n):
 # Main testing function.
 # ---------------------------
 def test_all(n_max=20):
+    import pandas as pd
+    import sympy as sp
     x = sp.symbols('x')
 
     # Closed-form generating functions:
@@ -0,0 +1,273 @@
+"""
+Pattern-Count Invariants for Full Binary Trees
+
+A pattern is a small rooted binary shape written in the nested-tuple form of
+test1.py ("L" for a leaf, (left, right) for an internal node).  An occurrence
+of a pattern in a tree is an internal node whose fringe subtree (the node and
+all of its descendants) has that shape.  Cherries are occurrences of
+("L", "L"), pitchforks of ("L", ("L", "L")) and k-caterpillars of the
+caterpillar with k leaves.  By default shapes are compared up to swapping the
+children of any node, so ("L", ("L", "L")) and (("L", "L"), "L") are the same
+pattern; pass unordered=False to count ordered shapes only.
+
+For a pattern P with p leaves the count is additive at the root,
+    X_P(T) = X_P(T_l) + X_P(T_r) + [T has shape P],
+and the indicator can only fire when n = p.  This gives
+  - totals:        X_P(n) = sum_i X_P(i)*T(n-i) + X_P(n-i)*T(i)  (+ m_P if n == p)
+  - distributions: c_P[n][k] = sum_i sum_{a+b=k} c_P[i][a]*c_P[n-i][b], where at
+                   n == p the m_P trees of shape P move from k = 0 to k = 1,
+where m_P is the number of ordered trees with shape P.
+
+A PatternSet batches many patterns: one post-order sweep assigns each node the
+id of its shape among all sub-shapes of all patterns, and one DP loop over
+(n, i) splits updates the totals and distributions of every pattern.
+"""
+
+import unittest
+from collections import defaultdict
+
+from treearray import LEAF, from_nested
+
+CHERRY = ("L", "L")
+PITCHFORK = ("L", ("L", "L"))
+
+
+def caterpillar(k):
+    """Return the caterpillar (maximally unbalanced tree) with k >= 2 leaves."""
+    tree = "L"
+    for _ in range(k - 1):
+        tree = ("L", tree)
+    return tree
+
+
+class PatternSet:
+    """
+    A batch of patterns that share one traversal per tree and one DP.
+
+    Every distinct sub-shape of every pattern receives an integer id; the leaf
+    has id 0.  A tree node gets the id of the pair (id(left), id(right)) when
+    that pair is a known sub-shape and -1 otherwise, so each node costs one
+    dictionary lookup regardless of the number of patterns.
+    """
+
+    def __init__(self, patterns, unordered=True):
+        self.patterns = list(patterns)
+        self.unordered = unordered
+        self._pair_ids = {}
+        self._targets = defaultdict(list)
+        self.sizes = []
+        self.multiplicities = []
+        for index, pattern in enumerate(self.patterns):
+            if pattern == "L":
+                raise ValueError("A pattern must have at least one internal node.")
+            shape_id, size, mult = self._register(pattern)
+            self._targets[shape_id].append(index)
+            self.sizes.append(size)
+            self.multiplicities.append(mult)
+
+    def _key(self, a, b):
+        if self.unordered and a > b:
+            return (b, a)
+        return (a, b)
+
+    def _register(self, pattern):
+        """
+        Assign ids to all sub-shapes of a pattern.
+        Returns (id, leaves, m) where m is the number of ordered trees with
+        this shape (1 when unordered is False).
+        """
+        info = {}
+        stack = [(pattern, False)]
+        result = []
+        while stack:
+            node, expanded = stack.pop()
+            if node == "L":
+                result.append((0, 1, 1))
+            elif expanded:
+                rid, rsize, rmult = result.pop()
+                lid, lsize, lmult = result.pop()
+                key = self._key(lid, rid)
+                if key not in self._pair_ids:
+                    self._pair_ids[key] = len(self._pair_ids) + 1
+                mult = lmult * rmult
+                if self.unordered and lid != rid:
+                    mult *= 2
+                result.append((self._pair_ids[key], lsize + rsize, mult))
+            else:
+                stack.append((node, True))
+                stack.append((node[1], False))
+                stack.append((node[0], False))
+        return result[0]
+
+    # -------------------------------------------------------------------------
+    # Per-tree counts
+    # -------------------------------------------------------------------------
+
+    def count(self, left, right):
+        """
+        Count occurrences of every pattern in an array-encoded tree (see
+        treearray.py) in a single O(n) post-order sweep.
+        Returns a list of counts, one per pattern.
+        """
+        counts = [0] * len(self.patterns)
+        pair_ids = self._pair_ids
+        targets = self._targets
+        unordered = self.unordered
+        ids = [0] * len(left)
+        for v in range(len(left)):
+            l = left[v]
+            if l == LEAF:
+                continue
+            a = ids[l]
+            b = ids[right[v]]
+            if a < 0 or b < 0:
+                ids[v] = -1
+                continue
+            if unordered and a > b:
+                a, b = b, a
+            shape_id = pair_ids.get((a, b), -1)
+            ids[v] = shape_id
+            if shape_id in targets:
+                for index in targets[shape_id]:
+                    counts[index] += 1
+        return counts
+
+    def count_nested(self, tree):
+        """Count occurrences of every pattern in a nested-tuple tree."""
+        return self.count(*from_nested(tree))
+
+    # -------------------------------------------------------------------------
+    # Exact totals and distributions over all trees with n leaves
+    # -------------------------------------------------------------------------
+
+    def totals(self, n_max):
+        """
+        Return (T, X) where T[n] is the number of trees with n leaves and
+        X[k][n] is the total number of occurrences of pattern k over all of
+        them, for 1 <= n <= n_max.
+        """
+        T = [0] * (n_max + 1)
+        X = [[0] * (n_max + 1) for _ in self.patterns]
+        if n_max >= 1:
+            T[1] = 1
+        for n in range(2, n_max + 1):
+            T_n = 0
+            X_n = [0] * len(self.patterns)
+            for i in range(1, n):
+                j = n - i
+                T_n += T[i] * T[j]
+                for k, Xk in enumerate(X):
+                    X_n[k] += Xk[i] * T[j] + Xk[j] * T[i]
+            T[n] = T_n
+            for k, size in enumerate(self.sizes):
+                if size == n:
+                    X_n[k] += self.multiplicities[k]
+                X[k][n] = X_n[k]
+        return T, X
+
+    def distributions(self, n_max):
+        """
+        Return D where D[k][n] is a dict mapping an occurrence count to the
+        number of trees with n leaves having that many occurrences of pattern k.
+        """
+        D = [[defaultdict(int) for _ in range(n_max + 1)] for _ in self.patterns]
+        if n_max >= 1:
+            for Dk in D:
+                Dk[1][0] = 1
+        for n in range(2, n_max + 1):
+            for i in range(1, n):
+                j = n - i
+                for Dk in D:
+                    row = Dk[n]
+                    for a, valL in Dk[i].items():
+                        for b, valR in Dk[j].items():
+                            row[a + b] += valL * valR
+            for k, size in enumerate(self.sizes):
+                if size == n:
+                    mult = self.multiplicities[k]
+                    D[k][n][0] -= mult
+                    D[k][n][1] += mult
+                    if D[k][n][0] == 0:
+                        del D[k][n][0]
+        return D
+
+
+def count_patterns(tree, patterns, unordered=True):
+    """Convenience wrapper: count several patterns in one nested-tuple tree."""
+    return PatternSet(patterns, unordered).count_nested(tree)
+
+
+class TestPatterns(unittest.TestCase):
+
+    def setUp(self):
+        from ntest2 import generate_trees
+        self.generate_trees = generate_trees
+        self.patterns = [CHERRY, PITCHFORK, caterpillar(4), (CHERRY, CHERRY),
+                         (PITCHFORK, CHERRY)]
+
+    def brute_force(self, tree, pattern, unordered):
+        """Reference count that compares fringe subtrees directly."""
+        def canon(t):
+            if t == "L":
+                return t
+            a, b = canon(t[0]), canon(t[1])
+            return tuple(sorted((a, b), key=repr)) if unordered else (a, b)
+        target = canon(pattern)
+        total = 0
+        stack = [tree]
+        while stack:
+            t = stack.pop()
+            if t == "L":
+                continue
+            total += canon(t) == target
+            stack.extend(t)
+        return total
+
+    def test_per_tree_counts_match_brute_force(self):
+        for unordered in (True, False):
+            ps = PatternSet(self.patterns, unordered)
+            for n in range(1, 8):
+                for tree in self.generate_trees(n):
+                    expected = [self.brute_force(tree, p, unordered) for p in self.patterns]
+                    self.assertEqual(ps.count_nested(tree), expected)
+
+    def test_totals_and_distributions_match_enumeration(self):
+        max_n = 9
+        for unordered in (True, False):
+            ps = PatternSet(self.patterns, unordered)
+            T, X = ps.totals(max_n)
+            D = ps.distributions(max_n)
+            for n in range(1, max_n + 1):
+                trees = self.generate_trees(n)
+                self.assertEqual(len(trees), T[n])
+                dist = [defaultdict(int) for _ in self.patterns]
+                for tree in trees:
+                    for k, c in enumerate(ps.count_nested(tree)):
+                        dist[k][c] += 1
+                for k in range(len(self.patterns)):
+                    self.assertEqual(sum(c * m for c, m in dist[k].items()), X[k][n])
+                    self.assertEqual(dict(dist[k]), dict(D[k][n]))
+
+    def test_cherries_match_existing_engines(self):
+        from cherry import build_cherry_coeff_table
+        from ntest2 import compute_invariants
+        max_n = 15
+        ps = PatternSet([CHERRY])
+        _, X = ps.totals(max_n)
+        D = ps.distributions(max_n)
+        X_ref = compute_invariants(max_n)[4]
+        ctable = build_cherry_coeff_table(max_n - 1)
+        for n in range(1, max_n + 1):
+            self.assertEqual(X[0][n], X_ref[n])
+            # cherry.py indexes by internal nodes (n - 1) rather than leaves.
+            expected = {k: v for k, v in ctable[n - 1].items() if v}
+            self.assertEqual(dict(D[0][n]), expected)
+
+    def test_pitchfork_multiplicity(self):
+        ps = PatternSet([PITCHFORK, caterpillar(4), (CHERRY, CHERRY)])
+        self.assertEqual(ps.multiplicities, [2, 4, 1])
+        self.assertEqual(PatternSet([PITCHFORK], unordered=False).multiplicities, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
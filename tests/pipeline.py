@@ -0,0 +1,279 @@
+"""
+Batch Pipeline for Scoring Tree Corpora
+
+Every other script scores shapes it generates itself, in one process.  This
+pipeline scores trees read from files (Newick, one or more trees per file,
+each terminated by ';'; labels, quoted labels, branch lengths, support
+values and [comments] are ignored, and every internal node must have two
+children):
+
+  1. read_newick streams tree strings from the input files;
+  2. score_corpus cuts the stream into chunks of chunk_size trees and fans
+     the chunks out to a process pool, where each worker parses its trees
+     into post-order arrays (treearray.py) and evaluates S, C, Phi, X and S2
+     (montecarlo.tree_invariants);
+  3. results are yielded strictly in input order.  At most max_in_flight
+     chunks are submitted at any time and the oldest is always awaited
+     first, so memory stays bounded however long the corpus is.
+
+Progress records trees, leaves and chunks done with throughput rates and is
+passed to an optional callback after every chunk.  score_files wires the
+stages to a CSV writer.
+"""
+
+import csv
+import os
+import re
+import time
+import unittest
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from treearray import LEAF
+
+INVARIANTS = ("S", "C", "Phi", "X", "S2")
+# A [comment], a 'quoted label' ('' escapes a quote), punctuation, or any other
+# run of text.  The closing bracket or quote is optional so that every
+# character belongs to some token.
+_TOKEN = re.compile(r"\[[^\]]*\]?|'(?:[^']|'')*'?|[(),;]|[^(),;'\[]+")
+# Characters read_newick looks for outside, inside a quote and inside a comment.
+_OPEN = re.compile(r"[;'\[]")
+_CLOSE = {"'": re.compile("'"), "[": re.compile(r"\]")}
+
+
+def from_newick(text):
+    """Post-order (left, right) lists of a binary Newick tree (topology only)."""
+    left = []
+    right = []
+    stack = [[]]
+    expect_child = True
+
+    def leaf():
+        left.append(LEAF)
+        right.append(LEAF)
+        stack[-1].append(len(left) - 1)
+
+    for token in _TOKEN.findall(text):
+        if token.startswith("["):
+            continue
+        if token == "(":
+            stack.append([])
+            expect_child = True
+        elif token in ",)":
+            if expect_child:
+                leaf()
+            if token == ",":
+                expect_child = True
+                continue
+            children = stack.pop()
+            if len(children) != 2 or not stack:
+                raise ValueError(f"Not a binary tree: {text[:60]!r}")
+            left.append(children[0])
+            right.append(children[1])
+            stack[-1].append(len(left) - 1)
+            expect_child = False
+        elif token == ";":
+            break
+        elif expect_child and token.strip():
+            # A label where a child is expected is a leaf; labels and branch
+            # lengths after ')' or a leaf are skipped.
+            leaf()
+            expect_child = False
+    if expect_child and len(stack) == 1 and not stack[0]:
+        leaf()
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise ValueError(f"Unbalanced Newick string: {text[:60]!r}")
+    return left, right
+
+
+def read_newick(paths, block=1 << 20):
+    """
+    Yield the Newick strings of all trees in the given files, in order.  A ';'
+    inside a quoted label or a [comment] does not end a tree, also when the
+    quote or comment spans two blocks.
+    """
+    for path in paths:
+        with open(path) as f:
+            pending = ""
+            scanned = 0
+            state = None  # "'" inside a quoted label, "[" inside a comment
+            for data in iter(lambda: f.read(block), ""):
+                pending += data
+                start = 0
+                pos = scanned
+                while True:
+                    match = (_CLOSE[state] if state else _OPEN).search(pending, pos)
+                    if match is None:
+                        break
+                    pos = match.end()
+                    if state:
+                        state = None
+                    elif match.group() != ";":
+                        state = match.group()
+                    else:
+                        tree = pending[start:match.start()].strip()
+                        if tree:
+                            yield tree + ";"
+                        start = pos
+                pending = pending[start:]
+                scanned = len(pending)
+            if pending.strip():
+                yield pending.strip() + ";"
+
+
+def _score_chunk(trees):
+    from montecarlo import tree_invariants
+    out = []
+    for text in trees:
+        left, right = from_newick(text)
+        out.append(((len(left) + 1) // 2,) + tree_invariants(left, right))
+    return out
+
+
+class Progress:
+    """Counters of a running pipeline."""
+
+    def __init__(self):
+        self.trees = 0
+        self.leaves = 0
+        self.chunks = 0
+        self.start = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def trees_per_second(self):
+        return self.trees / max(self.elapsed, 1e-9)
+
+    @property
+    def leaves_per_second(self):
+        return self.leaves / max(self.elapsed, 1e-9)
+
+    def __repr__(self):
+        return (f"Progress(trees={self.trees}, chunks={self.chunks}, "
+                f"{self.trees_per_second:.0f} trees/s, {self.leaves_per_second:.0f} leaves/s)")
+
+
+def score_corpus(trees, workers=None, chunk_size=64, max_in_flight=None, progress=None,
+                 callback=None):
+    """
+    Score an iterable of Newick strings.  Yields (n, S, C, Phi, X, S2) per
+    tree in input order.  workers=1 runs in-process; max_in_flight defaults
+    to twice the number of workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    progress = progress if progress is not None else Progress()
+    source = iter(trees)
+    chunks = iter(lambda: list(islice(source, chunk_size)), [])
+
+    def account(results):
+        progress.trees += len(results)
+        progress.leaves += sum(r[0] for r in results)
+        progress.chunks += 1
+        if callback is not None:
+            callback(progress)
+        return results
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from account(_score_chunk(chunk))
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_score_chunk, chunk))
+            if len(pending) >= max_in_flight:
+                yield from account(pending.popleft().result())
+        while pending:
+            yield from account(pending.popleft().result())
+
+
+def score_files(paths, output, **options):
+    """Score every tree in the Newick files and write a CSV; returns the Progress."""
+    progress = Progress()
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("index", "n") + INVARIANTS)
+        for index, row in enumerate(score_corpus(read_newick(paths), progress=progress, **options)):
+            writer.writerow((index,) + row)
+    return progress
+
+
+def to_newick(left, right):
+    """Newick string of an encoded tree with leaves labelled by post-order index."""
+    text = [None] * len(left)
+    for v in range(len(left)):
+        text[v] = f"t{v}" if left[v] == LEAF else f"({text[left[v]]},{text[right[v]]})"
+    return text[-1] + ";"
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_newick_round_trip(self):
+        import random
+        from splitmodels import random_tree
+        from treearray import from_nested
+        rng = random.Random(8)
+        for n in (1, 2, 9, 300):
+            left, right = random_tree(n, rng=rng)
+            self.assertEqual(from_newick(to_newick(left, right)), (left, right))
+        l, r = from_nested((("L", "L"), "L"))
+        for text in ("((A:0.1,B:0.2)90:0.3,C);", "((,),);", "( (a , b) , 'c' ) ;"):
+            self.assertEqual(from_newick(text), (list(l), list(r)))
+        self.assertEqual(from_newick("A;"), ([LEAF], [LEAF]))
+        for bad in ("(A,B,C);", "((A,B);", "(A);"):
+            with self.assertRaises(ValueError):
+                from_newick(bad)
+
+    def test_quoted_labels_and_comments(self):
+        import tempfile
+        from treearray import from_nested
+        l, r = from_nested((("L", "L"), "L"))
+        trees = ["[&R] (('a,b':1[&&NHX:S=x;y],'it''s (c)'),[,;]d);",
+                 "(('x;y',B)[90],'C)');"]
+        for text in trees:
+            self.assertEqual(from_newick(text), (list(l), list(r)))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "quoted.nwk")
+            with open(path, "w") as f:
+                f.write("\n".join(trees) + "\n")
+            for block in (1, 3, 1 << 20):
+                self.assertEqual(list(read_newick([path], block)), trees)
+
+    def test_ordered_parallel_scoring(self):
+        import random
+        import tempfile
+        from montecarlo import tree_invariants
+        from splitmodels import random_tree
+        rng = random.Random(1)
+        trees = [random_tree(rng.randrange(1, 60), rng=rng) for _ in range(500)]
+        expected = [((len(l) + 1) // 2,) + tree_invariants(l, r) for l, r in trees]
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for part in range(3):
+                path = os.path.join(tmp, f"trees{part}.nwk")
+                with open(path, "w") as f:
+                    for l, r in trees[part::3]:
+                        f.write(to_newick(l, r) + "\n")
+                paths.append(path)
+            order = [t for part in range(3) for t in expected[part::3]]
+            seen = []
+            got = list(score_corpus(read_newick(paths), workers=3, chunk_size=7, max_in_flight=2,
+                                    callback=lambda p: seen.append(p.trees)))
+            self.assertEqual(got, order)
+            self.assertEqual(seen[-1], 500)
+            self.assertEqual(seen, sorted(seen))
+            progress = score_files(paths, os.path.join(tmp, "out.csv"), workers=1, chunk_size=50)
+            self.assertEqual((progress.trees, progress.chunks), (500, 10))
+            with open(os.path.join(tmp, "out.csv")) as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(rows[0], ["index", "n", "S", "C", "Phi", "X", "S2"])
+            self.assertEqual([tuple(map(int, row[1:])) for row in rows[1:]], order)
+
+
+if __name__ == '__main__':
+    unittest.main()
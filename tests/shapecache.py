@@ -0,0 +1,189 @@
+"""
+Canonical Hashing of Unordered Shapes and an Invariant Result Cache
+
+The nested-tuple form of test1.py is ordered: (A, B) and (B, A) are different
+objects although Colless, Sackin, Phi, cherries and Sackin2 cannot tell them
+apart.  Corpora of real trees and bootstrap replicates repeat shapes (often as
+mirror images), so scoring each unordered shape once saves most of the work.
+
+Two canonical forms, both computed in one post-order sweep (AHU):
+  - ShapeTable.canonical_id interns the pair {id(left), id(right)}, smaller id
+    first, in a table shared by all trees, so isomorphic shapes get the same
+    small integer.  Ids are exact but only meaningful within one table.
+  - canonical_hash combines the children's digests the same way with BLAKE2b
+    into a 16-byte digest that is stable across processes and runs, for keys
+    that go to disk.
+
+InvariantCache maps canonical hashes to invariant vectors with an in-memory
+LRU of bounded size and, optionally, a persistent SQLite file behind it.
+"""
+
+import sqlite3
+import unittest
+from collections import OrderedDict
+from hashlib import blake2b
+
+from treearray import LEAF
+
+INVARIANTS = ("S", "C", "Phi", "X", "S2")
+_LEAF_DIGEST = blake2b(b"L", digest_size=16).digest()
+
+
+class ShapeTable:
+    """Interning table of unordered shapes; the leaf has id 0."""
+
+    def __init__(self):
+        self._ids = {}
+
+    def __len__(self):
+        return len(self._ids) + 1
+
+    def canonical_id(self, left, right):
+        """Id of the unordered shape of an encoded tree, in O(n)."""
+        ids = self._ids
+        node = [0] * len(left)
+        for v in range(len(left)):
+            l = left[v]
+            if l == LEAF:
+                continue
+            a, b = node[l], node[right[v]]
+            key = (a, b) if a <= b else (b, a)
+            shape = ids.get(key)
+            if shape is None:
+                shape = ids[key] = len(ids) + 1
+            node[v] = shape
+        return node[-1]
+
+
+def canonical_hash(left, right):
+    """16-byte digest of the unordered shape of an encoded tree, in O(n)."""
+    digest = [_LEAF_DIGEST] * len(left)
+    for v in range(len(left)):
+        l = left[v]
+        if l == LEAF:
+            continue
+        a, b = digest[l], digest[right[v]]
+        if a > b:
+            a, b = b, a
+        digest[v] = blake2b(a + b, digest_size=16).digest()
+    return digest[-1]
+
+
+class InvariantCache:
+    """
+    Invariant vectors keyed by canonical_hash.  capacity bounds the in-memory
+    LRU; with path, entries are also kept in an SQLite file and survive the
+    process.  hits and misses count lookups by score().
+    """
+
+    def __init__(self, capacity=1 << 16, path=None):
+        self.capacity = capacity
+        self._lru = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            columns = ", ".join(f"{name} INTEGER" for name in INVARIANTS)
+            self._db.execute(f"CREATE TABLE IF NOT EXISTS invariants (key BLOB PRIMARY KEY, {columns})")
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _remember(self, key, values):
+        self._lru[key] = values
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        """Cached vector for a canonical hash, or None."""
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return self._lru[key]
+        if self._db is not None:
+            row = self._db.execute(
+                f"SELECT {', '.join(INVARIANTS)} FROM invariants WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._remember(key, row)
+                return row
+        return None
+
+    def put(self, key, values):
+        values = tuple(values)
+        self._remember(key, values)
+        if self._db is not None:
+            self._db.execute(f"INSERT OR REPLACE INTO invariants VALUES (?{', ?' * len(INVARIANTS)})",
+                             (key,) + values)
+
+    def score(self, left, right):
+        """(S, C, Phi, X, S2) of an encoded tree, computed once per unordered shape."""
+        from montecarlo import tree_invariants
+        key = canonical_hash(left, right)
+        values = self.get(key)
+        if values is None:
+            self.misses += 1
+            values = tree_invariants(left, right)
+            self.put(key, values)
+        else:
+            self.hits += 1
+        return values
+
+
+class TestShapeCache(unittest.TestCase):
+
+    def test_unordered_shapes(self):
+        from ntest2 import generate_trees
+        from treearray import from_nested
+
+        def canonical(tree):
+            if tree == "L":
+                return "L"
+            return tuple(sorted((canonical(tree[0]), canonical(tree[1])), key=repr))
+
+        table = ShapeTable()
+        for n in range(1, 9):
+            trees = list(generate_trees(n))
+            classes = {}
+            for tree in trees:
+                arrays = from_nested(tree)
+                classes.setdefault(canonical(tree), set()).add(
+                    (table.canonical_id(*arrays), canonical_hash(*arrays)))
+            # One id and one digest per unordered shape, all distinct.
+            self.assertTrue(all(len(c) == 1 for c in classes.values()))
+            self.assertEqual(len({next(iter(c)) for c in classes.values()}), len(classes))
+
+    def test_cache_lru_and_disk(self):
+        import os
+        import random
+        import tempfile
+        from splitmodels import random_tree
+        rng = random.Random(3)
+        trees = [random_tree(8, rng=rng) for _ in range(300)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cache.sqlite")
+            with InvariantCache(capacity=8, path=path) as cache:
+                first = [cache.score(*t) for t in trees]
+                self.assertLessEqual(len(cache._lru), 8)
+                self.assertEqual(cache.misses, len({canonical_hash(*t) for t in trees}))
+            with InvariantCache(capacity=4, path=path) as cache:
+                self.assertEqual([cache.score(*t) for t in trees], first)
+                self.assertEqual(cache.misses, 0)
+        mirrored = ([-1, -1, -1, 1, 0], [-1, -1, -1, 2, 3])
+        cache = InvariantCache()
+        cache.score([-1, -1, 0, -1, 2], [-1, -1, 1, -1, 3])
+        cache.score(*mirrored)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,343 @@
+"""
+Split Models: PDA, Yule and Aldous beta-splitting
+
+Every engine in ntest3.py assumes the uniform (PDA) model, in which a tree with
+n leaves splits into an ordered pair of subtrees with i and n - i leaves with
+probability
+    q_n(i) = T(i) * T(n-i) / T(n).
+A Markov branching model replaces this by an arbitrary split distribution
+q_n(i), 1 <= i <= n - 1, and draws the two subtrees independently.  Because
+each invariant here is additive at the root,
+    I(T) = I(T_l) + I(T_r) + f(n, i),
+its mean and variance follow the same O(n^2) recurrence under any q:
+    E[n]   = sum_i q_n(i) * g(i),      g(i) = E[i] + E[n-i] + f(n, i)
+    Var[n] = sum_i q_n(i) * (Var[i] + Var[n-i] + (g(i) - E[n])^2)
+(the law of total variance, which keeps every term nonnegative in float mode).
+Sackin2 additionally needs Cov(S, S2), propagated the same way.
+
+Models provided (each cached, with its split tables built lazily per n):
+  - pda():              uniform ordered trees, q_n(i) proportional to T(i)*T(n-i)
+  - yule():             q_n(i) = 1/(n-1)
+  - beta_splitting(b):  Aldous' beta-splitting, b > -2, q_n(i) proportional to
+                        Gamma(b+i+1)*Gamma(b+n-i+1) / (Gamma(i+1)*Gamma(n-i+1));
+                        b = 0 is Yule and b = -3/2 is PDA.
+
+Every computation runs in float64 or, with exact=True, in exact rationals
+(fractions.Fraction; beta must then be rational).
+"""
+
+import math
+import random
+import unittest
+from bisect import bisect_left
+from fractions import Fraction
+from functools import lru_cache
+from itertools import accumulate
+
+import numpy as np
+
+from treearray import LEAF
+
+INVARIANTS = ("S", "C", "Phi", "X", "S2")
+
+
+class SplitModel:
+    """
+    A Markov branching model given by its split distribution.
+
+    q_float(n) must return the n - 1 probabilities q_n(1..n-1) as floats and
+    q_exact(n) (optional) the same as Fractions.  Rows are computed once and
+    cached, together with cumulative rows used for sampling.
+    """
+
+    def __init__(self, name, q_float, q_exact=None):
+        self.name = name
+        self._q_float = q_float
+        self._q_exact = q_exact
+        self._float_rows = {}
+        self._exact_rows = {}
+        self._cumulative = {}
+
+    def __repr__(self):
+        return f"SplitModel({self.name!r})"
+
+    def split_probabilities(self, n, exact=False):
+        """Return q_n(1..n-1), as a float array or a list of Fractions."""
+        if exact:
+            if self._q_exact is None:
+                raise ValueError(f"Model {self.name} has no exact split distribution.")
+            if n not in self._exact_rows:
+                self._exact_rows[n] = self._q_exact(n)
+            return self._exact_rows[n]
+        if n not in self._float_rows:
+            self._float_rows[n] = np.asarray(self._q_float(n), dtype=float)
+        return self._float_rows[n]
+
+    def cumulative(self, n):
+        """Return the cumulative split probabilities for n, used by the sampler."""
+        if n not in self._cumulative:
+            cum = list(accumulate(self.split_probabilities(n).tolist()))
+            cum[-1] = 1.0
+            self._cumulative[n] = cum
+        return self._cumulative[n]
+
+    def sample_split(self, n, rng=random):
+        """Draw the left subtree size i for a tree with n >= 2 leaves."""
+        return bisect_left(self.cumulative(n), rng.random()) + 1
+
+
+def _factorized(name, log_weight, weight=None):
+    """
+    Build a model with q_n(i) proportional to w(i) * w(n - i), given log w for
+    float mode and (optionally) w as an exact rational.
+    """
+    log_weights = [0.0]
+
+    def q_float(n):
+        # log w(i) is shared by every row, so compute each value once.
+        log_weights.extend(log_weight(i) for i in range(len(log_weights), n))
+        lw = np.array(log_weights[1:n])
+        lq = lw + lw[::-1]
+        q = np.exp(lq - lq.max())
+        return q / q.sum()
+
+    q_exact = None
+    if weight is not None:
+        def q_exact(n):
+            w = [weight(i) * weight(n - i) for i in range(1, n)]
+            total = sum(w)
+            return [Fraction(x) / total for x in w]
+
+    return SplitModel(name, q_float, q_exact)
+
+
+@lru_cache(maxsize=None)
+def pda():
+    """Uniform model on ordered full binary trees (the model of ntest3.py)."""
+    return _factorized(
+        "pda",
+        lambda i: math.lgamma(2 * i - 1) - math.lgamma(i + 1) - math.lgamma(i),
+        lambda i: math.comb(2 * i - 2, i - 1) // i,
+    )
+
+
+@lru_cache(maxsize=None)
+def yule():
+    """Yule (random joining) model: every split size is equally likely."""
+    return SplitModel(
+        "yule",
+        lambda n: np.full(n - 1, 1.0 / (n - 1)),
+        lambda n: [Fraction(1, n - 1)] * (n - 1),
+    )
+
+
+@lru_cache(maxsize=None)
+def beta_splitting(beta):
+    """
+    Aldous' beta-splitting model for beta > -2.  The weight
+    w(i) = Gamma(beta+i+1) / Gamma(i+1) is taken relative to w(1), i.e.
+    w(i) = prod_{k=2}^{i} (beta + k) / k, which is rational for rational beta.
+    """
+    if beta <= -2:
+        raise ValueError("beta-splitting requires beta > -2.")
+    exact_beta = Fraction(beta)
+
+    @lru_cache(maxsize=None)
+    def weight(i):
+        if i == 1:
+            return Fraction(1)
+        return weight(i - 1) * (exact_beta + i) / i
+
+    return _factorized(
+        f"beta({beta})",
+        lambda i: math.lgamma(beta + i + 1) - math.lgamma(i + 1),
+        weight,
+    )
+
+
+# -----------------------------------------------------------------------------
+# Moment engine
+# -----------------------------------------------------------------------------
+
+def _root_terms(n, exact):
+    """Root contributions f(n, i), i = 1..n-1, for S, C, Phi and X."""
+    i = np.arange(1, n, dtype=object if exact else float)
+    j = n - i
+    return {
+        "S": np.full(n - 1, n, dtype=i.dtype),
+        "C": abs(2 * i - n),
+        "Phi": i * (i - 1) // 2 + j * (j - 1) // 2 if exact else (i * (i - 1) + j * (j - 1)) / 2,
+        "X": np.full(n - 1, 1 if n == 2 else 0, dtype=i.dtype),
+    }
+
+
+def invariant_moments(N, model=None, exact=False):
+    """
+    Means and variances of the Sackin (S), Colless (C), total cophenetic (Phi),
+    cherry (X) and Sackin2 (S2) indices for 1 <= n <= N under a split model
+    (default: PDA).
+    Returns (mean, var): dicts keyed by invariant name, each a list indexed by n.
+    """
+    model = model or pda()
+    dtype = object if exact else float
+    zero = Fraction(0) if exact else 0.0
+    mean = {k: np.full(N + 1, zero, dtype=dtype) for k in INVARIANTS}
+    var = {k: np.full(N + 1, zero, dtype=dtype) for k in INVARIANTS}
+    cov_S_S2 = np.full(N + 1, zero, dtype=dtype)
+
+    for n in range(2, N + 1):
+        q = np.asarray(model.split_probabilities(n, exact), dtype=dtype)
+        f = _root_terms(n, exact)
+        g = {}
+        for k in ("S", "C", "Phi", "X"):
+            E = mean[k]
+            g[k] = E[1:n] + E[n - 1:0:-1] + f[k]
+        # S2 = S2_l + S2_r + 2 (S_l + S_r) + n
+        S_sum = mean["S"][1:n] + mean["S"][n - 1:0:-1]
+        g["S2"] = mean["S2"][1:n] + mean["S2"][n - 1:0:-1] + 2 * S_sum + n
+
+        for k in INVARIANTS:
+            mean[k][n] = q.dot(g[k])
+        # Within-split variances.
+        within = {}
+        for k in ("S", "C", "Phi", "X"):
+            within[k] = var[k][1:n] + var[k][n - 1:0:-1]
+        vS = within["S"]
+        cSS2 = cov_S_S2[1:n] + cov_S_S2[n - 1:0:-1]
+        within["S2"] = var["S2"][1:n] + var["S2"][n - 1:0:-1] + 4 * vS + 4 * cSS2
+        within_cov = cSS2 + 2 * vS
+
+        for k in INVARIANTS:
+            dev = g[k] - mean[k][n]
+            var[k][n] = q.dot(within[k] + dev * dev)
+        cov_S_S2[n] = q.dot(within_cov + (g["S"] - mean["S"][n]) * (g["S2"] - mean["S2"][n]))
+
+    return {k: v.tolist() for k, v in mean.items()}, {k: v.tolist() for k, v in var.items()}
+
+
+# -----------------------------------------------------------------------------
+# Sampler
+# -----------------------------------------------------------------------------
+
+def random_tree(n, model=None, rng=random):
+    """
+    Draw a tree with n leaves from a split model (default: PDA) and return it
+    in the post-order array encoding of treearray.py.  Construction is
+    iterative, so n is limited only by memory.
+    """
+    model = model or pda()
+    left = []
+    right = []
+    emitted = []
+    stack = [(n, False)]
+    while stack:
+        size, expanded = stack.pop()
+        if size == 1:
+            left.append(LEAF)
+            right.append(LEAF)
+            emitted.append(len(left) - 1)
+        elif expanded:
+            r = emitted.pop()
+            l = emitted.pop()
+            left.append(l)
+            right.append(r)
+            emitted.append(len(left) - 1)
+        else:
+            i = model.sample_split(size, rng)
+            stack.append((size, True))
+            stack.append((size - i, False))
+            stack.append((i, False))
+    return left, right
+
+
+class TestSplitModels(unittest.TestCase):
+
+    def enumerate_with_probabilities(self, n, model):
+        """All trees with n leaves as (probability, S, C, Phi, X, S2)."""
+        if n == 1:
+            return [(Fraction(1), 0, 0, 0, 0, 0)]
+        out = []
+        q = model.split_probabilities(n, exact=True)
+        for i in range(1, n):
+            j = n - i
+            for pl, Sl, Cl, Pl, Xl, Ql in self.enumerate_with_probabilities(i, model):
+                for pr, Sr, Cr, Pr, Xr, Qr in self.enumerate_with_probabilities(j, model):
+                    out.append((q[i - 1] * pl * pr,
+                                Sl + Sr + n,
+                                Cl + Cr + abs(i - j),
+                                Pl + Pr + i * (i - 1) // 2 + j * (j - 1) // 2,
+                                Xl + Xr + (1 if n == 2 else 0),
+                                Ql + Qr + 2 * (Sl + Sr) + n))
+        return out
+
+    def test_exact_moments_match_enumeration(self):
+        N = 7
+        for model in (pda(), yule(), beta_splitting(Fraction(1, 3))):
+            mean, var = invariant_moments(N, model, exact=True)
+            for n in range(1, N + 1):
+                trees = self.enumerate_with_probabilities(n, model)
+                self.assertEqual(sum(t[0] for t in trees), 1)
+                for k, name in enumerate(INVARIANTS, start=1):
+                    m = sum(t[0] * t[k] for t in trees)
+                    v = sum(t[0] * (t[k] - m) ** 2 for t in trees)
+                    self.assertEqual(mean[name][n], m, (model, n, name))
+                    self.assertEqual(var[name][n], v, (model, n, name))
+
+    def test_pda_matches_totals(self):
+        from ntest3 import compute_invariants
+        N = 40
+        T, S, C, Phi, X, S2 = compute_invariants(N)
+        mean, _ = invariant_moments(N, pda(), exact=True)
+        for n in range(1, N + 1):
+            for name, tot in zip(INVARIANTS, (S, C, Phi, X, S2)):
+                self.assertEqual(mean[name][n], Fraction(tot[n], T[n]))
+
+    def test_beta_special_cases(self):
+        N = 30
+        for n in range(2, N + 1):
+            self.assertEqual(beta_splitting(0).split_probabilities(n, exact=True),
+                             yule().split_probabilities(n, exact=True))
+            self.assertEqual(beta_splitting(-1.5).split_probabilities(n, exact=True),
+                             pda().split_probabilities(n, exact=True))
+
+    def test_yule_closed_forms(self):
+        N = 200
+        mean, var = invariant_moments(N, yule())
+        for n in (3, 50, 200):
+            harmonic = sum(1 / k for k in range(1, n + 1))
+            self.assertAlmostEqual(mean["S"][n] / (2 * n * (harmonic - 1)), 1, places=12)
+            self.assertAlmostEqual(mean["X"][n], n / 3, places=10)
+            # McKenzie & Steel: Var[X] = 2n/45 for n >= 5 under Yule.
+            if n >= 5:
+                self.assertAlmostEqual(var["X"][n], 2 * n / 45, places=10)
+
+    def test_float_matches_exact(self):
+        N = 60
+        for model in (pda(), yule(), beta_splitting(1)):
+            mf, vf = invariant_moments(N, model)
+            me, ve = invariant_moments(N, model, exact=True)
+            for name in INVARIANTS:
+                for n in range(2, N + 1):
+                    if me[name][n]:
+                        self.assertAlmostEqual(mf[name][n] / float(me[name][n]), 1, places=11)
+                    if ve[name][n]:
+                        self.assertAlmostEqual(vf[name][n] / float(ve[name][n]), 1, places=9)
+
+    def test_sampler(self):
+        rng = random.Random(1)
+        for model in (pda(), yule(), beta_splitting(-1)):
+            left, right = random_tree(500, model, rng)
+            self.assertEqual(len(left), 999)
+            self.assertEqual(sum(1 for x in left if x == LEAF), 500)
+        # Empirical cherry mean under Yule is n/3.
+        n, reps = 30, 3000
+        total = 0
+        for _ in range(reps):
+            left, right = random_tree(n, yule(), rng)
+            total += sum(1 for v in range(len(left))
+                         if left[v] != LEAF and left[left[v]] == LEAF and left[right[v]] == LEAF)
+        self.assertLess(abs(total / reps - n / 3), 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
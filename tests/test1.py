@@ -23,9 +23,6 @@ Date: February 5th, 2025
 """
 
 import sympy as sp
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 
 # -----------------------------
 # Part 1: Tree Generation and Invariant Functions
@@ -175,10 +172,9 @@ for inv in ['cherries', 'colless', 'sackin']:
 # -----------------------------
 # Part 5: (Optional) Plotting Distributions for a Selected n
 # -----------------------------
-import matplotlib.pyplot as plt
-
 def plot_distribution(invariant, n, data):
     """Plot the frequency distribution of the specified invariant for trees with n leaves."""
+    import matplotlib.pyplot as plt
     freq = data[invariant][n]['frequency']
     values = sorted(freq.keys())
     counts = [freq[val] for val in values]
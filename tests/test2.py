@@ -24,9 +24,6 @@ This script is designed to be rigorous and self-contained.
 """
 
 import sympy as sp
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 
 # -----------------------------------------------------------------------------
 # Part I. Full Binary Trees and Invariants
@@ -16,9 +16,6 @@ This test suite verifies our unified framework by:
 """
 
 import sympy as sp
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 
 # =============================================================================
 # Part I. Utility Functions: Full Binary Trees & Invariants
@@ -0,0 +1,193 @@
+"""
+Tests of the treeinv command-line tool and of its cold start
+
+treeinv.py itself imports no test machinery, so its tests live here.
+TestStartup runs the tool in fresh interpreters: the totals path must not
+load NumPy, sympy, pandas, matplotlib, unittest or the engines of the other
+subcommands, and the engine modules must import without the heavy ones.  Start-up time follows from these properties, so
+it is not asserted on the wall clock.
+"""
+
+import math
+import os
+import subprocess
+import sys
+import unittest
+
+import treeinv
+
+HEAVY = ("numpy", "sympy", "pandas", "matplotlib", "unittest")
+# Engines of the other subcommands, which `totals` must not import either.
+ENGINES = ("columnar", "tiledp", "montecarlo", "splitmodels", "pipeline", "shapecache")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(code):
+    return subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True,
+                          capture_output=True, text=True).stdout
+
+
+class TestTreeinv(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _csv(self, path):
+        import csv
+        with open(path) as f:
+            return list(csv.reader(f))
+
+    def test_totals_formats_and_resume(self):
+        from columnar import ColumnarTable
+        from fastpath import compute_invariants_fast
+        T, S, C, Phi, X, S2 = compute_invariants_fast(80)
+        path = os.path.join(self.tmp, "totals.csv")
+        treeinv.main(["totals", "--n-max", "50", "--invariants", "S,C", "-o", path])
+        with open(path, "a") as f:
+            f.write("51,12")  # an interrupted row
+        treeinv.main(["totals", "--n-max", "80", "--invariants", "S,C", "-o", path, "--resume"])
+        rows = self._csv(path)
+        self.assertEqual(rows[0], ["n", "S", "C"])
+        self.assertEqual(rows[1:], [[str(n), str(S[n]), str(C[n])] for n in range(1, 81)])
+
+        path = os.path.join(self.tmp, "totals")
+        treeinv.main(["totals", "--n-max", "40", "--format", "binary", "-o", path,
+                      "--chunk-rows", "16"])
+        treeinv.main(["totals", "--n-max", "80", "--format", "binary", "-o", path, "--resume"])
+        table = ColumnarTable(path)
+        for name, seq in zip(treeinv.TOTALS, (T, S, C, Phi, X, S2)):
+            self.assertEqual(table.values(name), seq[1:])
+        with self.assertRaises(SystemExit):
+            treeinv.main(["totals", "--n-max", "5", "--invariants", "S,Q"])
+
+    def test_totals_beyond_int_str_digit_limit(self):
+        # S(n) has more than 4300 decimal digits from n = 7144 on.
+        path = os.path.join(self.tmp, "big.csv")
+        limit = getattr(sys, "get_int_max_str_digits", lambda: None)()
+        treeinv.main(["totals", "--n-max", "7300", "--invariants", "S", "-o", path])
+        with open(path) as f:
+            last = f.readlines()[-1].rstrip("\n").split(",")
+        n = 7300
+        S = 4 ** (n - 1) - n * (math.comb(2 * n - 2, n - 1) // n)
+        self.assertEqual(last[0], "7300")
+        self.assertGreater(len(last[1]), 4300)
+        if limit is None:
+            self.assertEqual(int(last[1]), S)
+            return
+        # main() restores the limit, so the check lifts it on its own.
+        self.assertEqual(sys.get_int_max_str_digits(), limit)
+        sys.set_int_max_str_digits(0)
+        try:
+            self.assertEqual(int(last[1]), S)
+        finally:
+            sys.set_int_max_str_digits(limit)
+
+    def test_engine_errors_are_not_usage_errors(self):
+        missing = os.path.join(self.tmp, "missing.nwk")
+        with self.assertRaises(FileNotFoundError):
+            treeinv.main(["score", missing, "--workers", "1",
+                          "-o", os.path.join(self.tmp, "s.csv")])
+
+    def test_model_errors(self):
+        import contextlib
+        import io
+        for model, message in (("kingman", "Unknown model 'kingman'"),
+                               ("-2", "beta-splitting requires beta > -2")):
+            stderr = io.StringIO()
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(stderr):
+                treeinv.main(["sample", "--n", "5", "--count", "1", "--model", model])
+            self.assertIn(message, stderr.getvalue())
+
+    def test_distribution_without_table_removes_its_directory(self):
+        import tempfile
+        out = os.path.join(self.tmp, "dist.csv")
+        saved = tempfile.tempdir
+        tempfile.tempdir = os.path.join(self.tmp, "scratch")
+        os.mkdir(tempfile.tempdir)
+        try:
+            treeinv.main(["distribution", "--invariant", "sackin", "--n-max", "8", "-o", out])
+            self.assertEqual(os.listdir(tempfile.tempdir), [])
+        finally:
+            tempfile.tempdir = saved
+        self.assertEqual(self._csv(out)[-1][0], "8")
+
+    def test_distribution_sample_and_score(self):
+        from pipeline import to_newick
+        from splitmodels import random_tree
+        from tiledp import in_memory_distribution
+        out = os.path.join(self.tmp, "dist.csv")
+        table = os.path.join(self.tmp, "colless")
+        treeinv.main(["distribution", "--invariant", "colless", "--n-max", "9", "--table", table,
+                      "-o", out])
+        treeinv.main(["distribution", "--invariant", "colless", "--n-max", "12", "--table", table,
+                      "-o", out, "--resume"])
+        expected = in_memory_distribution("colless", 12)
+        self.assertEqual([tuple(map(int, r)) for r in self._csv(out)[1:]],
+                         [(n, k, c) for n in range(1, 13) for k, c in sorted(expected[n].items())])
+
+        sample = os.path.join(self.tmp, "sample.csv")
+        treeinv.main(["sample", "--n", "30", "--count", "5", "--model", "yule", "-o", sample])
+        treeinv.main(["sample", "--n", "30", "--count", "12", "--model", "yule", "-o", sample,
+                      "--resume"])
+        whole = os.path.join(self.tmp, "whole.csv")
+        treeinv.main(["sample", "--n", "30", "--count", "12", "--model", "yule", "-o", whole])
+        self.assertEqual(self._csv(sample), self._csv(whole))
+        self.assertEqual(len(self._csv(whole)), 13)
+
+        corpus = os.path.join(self.tmp, "corpus.nwk")
+        import random
+        rng = random.Random(4)
+        with open(corpus, "w") as f:
+            for _ in range(40):
+                f.write(to_newick(*random_tree(rng.randrange(1, 25), rng=rng)) + "\n")
+        plain, cached = os.path.join(self.tmp, "plain.csv"), os.path.join(self.tmp, "cached.csv")
+        treeinv.main(["score", corpus, "--workers", "1", "-o", plain])
+        treeinv.main(["score", corpus, "--cache", os.path.join(self.tmp, "shapes.sqlite"),
+                      "-o", cached])
+        self.assertEqual(self._csv(plain), self._csv(cached))
+        self.assertEqual(len(self._csv(plain)), 41)
+
+    def test_parquet_without_pyarrow(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            with self.assertRaises(SystemExit):
+                treeinv.main(["totals", "--n-max", "5", "--format", "parquet", "-o",
+                              os.path.join(self.tmp, "t.parquet")])
+        else:
+            import pyarrow.parquet as pq
+            from fastpath import compute_invariants_fast
+            path = os.path.join(self.tmp, "t.parquet")
+            treeinv.main(["totals", "--n-max", "70", "--format", "parquet", "-o", path,
+                          "--chunk-rows", "8"])
+            table = pq.read_table(path).to_pydict()
+            self.assertEqual([int(v) for v in table["S2"]], compute_invariants_fast(70)[5][1:])
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_totals_loads_no_heavy_modules(self):
+        output = _run("import sys, treeinv\n"
+                      "treeinv.main(['totals', '--n-max', '30', '--invariants', 'T,S,C'])\n"
+                      f"print([m for m in {HEAVY + ENGINES!r} if m in sys.modules])")
+        lines = output.splitlines()
+        self.assertEqual(lines[0], "n,T,S,C")
+        self.assertTrue(lines[30].startswith("30,"))
+        self.assertEqual(lines[-1], "[]")
+
+    def test_core_modules_import_lazily(self):
+        modules = ("core", "ntest2", "ntest3", "cherry", "treearray", "bigtable", "instrument",
+                   "fastpath", "tiledp", "membudget", "montecarlo", "pipeline", "shapecache")
+        loaded = _run(f"import sys\nfor m in {modules!r}: __import__(m)\n"
+                      "print(' '.join(m for m in ('numpy', 'sympy', 'pandas', 'matplotlib') "
+                      "if m in sys.modules))")
+        self.assertEqual(loaded.strip(), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
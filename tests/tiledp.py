@@ -0,0 +1,255 @@
+"""
+Out-of-Core Tiled DP for Bivariate Distribution Tables
+
+The bivariate DP of cherry.py keeps every row c[n][k] in memory.  For Sackin
+and Colless, row n has on the order of n^2 / 2 big-integer cells of about 2n
+bits each, so the full table grows like n^4 bits and does not fit in RAM for
+the sizes we need.  This engine computes the same tables,
+    c[1] = {0: 1},
+    c[n][k] = sum_i sum_a c[i][a] * c[n-i][k - f(n, i) - a],
+with the additive root terms f of ntest3.py (cherries: [n == 2], Sackin: n,
+Colless: |2i - n|), but keeps the table on disk:
+
+  - Every row is cut into tiles of tile_k consecutive k values, each stored as
+    a bigtable.py file.  Row n is produced one output tile at a time; for each
+    split (i, n - i), only the input tile pairs whose product reaches the
+    output tile are loaded, and they are multiplied by Kronecker substitution
+    (height.poly_mul_trunc).  Since f(n, i) = f(n, n - i), the splits i < n - i
+    are counted twice and i = n/2 once.
+  - Input tiles are held in an LRU cache limited to ram_budget bytes, so peak
+    memory is the budget plus one output tile, independent of n.
+  - Tiles are written atomically and a manifest records the last completed
+    row, so an interrupted build resumes where it stopped, reusing any tiles
+    of the unfinished row that were already written.
+
+Under instrument.profiling() the engine reports tile-cache hits and misses
+("tiledp.tiles"), the polynomial products with their coefficient sizes
+("tiledp.poly_mul") and the time of each row.
+"""
+
+import json
+import os
+import unittest
+from collections import OrderedDict
+
+import instrument
+from bigtable import BigTable, write_bigtable
+
+# Root term f(n, i) and the largest possible value k_max(n) of each invariant.
+INVARIANTS = {
+    "cherries": (lambda n, i: 1 if n == 2 else 0, lambda n: n // 2),
+    "sackin": (lambda n, i: n, lambda n: (n - 1) * (n + 2) // 2),
+    "colless": (lambda n, i: abs(2 * i - n), lambda n: (n - 1) * (n - 2) // 2),
+}
+
+
+class TiledDistribution:
+    """Disk-backed distribution table c[n][k] for one invariant."""
+
+    def __init__(self, directory, invariant, tile_k=256, ram_budget=256 << 20):
+        if invariant not in INVARIANTS:
+            raise ValueError(f"Unknown invariant {invariant!r}; choose from {sorted(INVARIANTS)}.")
+        self.directory = directory
+        self.invariant = invariant
+        self.root_term, self.k_max = INVARIANTS[invariant]
+        self.ram_budget = ram_budget
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        manifest = self._manifest_path()
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                meta = json.load(f)
+            if meta["invariant"] != invariant:
+                raise ValueError(f"{directory} holds a {meta['invariant']} table, not {invariant}.")
+            self.tile_k = meta["tile_k"]
+            self.completed = meta["completed"]
+        else:
+            self.tile_k = tile_k
+            self.completed = 0
+            self._write_manifest()
+
+    # -------------------------------------------------------------------------
+    # Storage
+    # -------------------------------------------------------------------------
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, "manifest.json")
+
+    def _write_manifest(self):
+        tmp = self._manifest_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"invariant": self.invariant, "tile_k": self.tile_k,
+                       "completed": self.completed}, f)
+        os.replace(tmp, self._manifest_path())
+
+    def _tile_path(self, n, t):
+        return os.path.join(self.directory, f"row{n:06d}_tile{t:06d}.bin")
+
+    def num_tiles(self, n):
+        """Number of tiles of row n."""
+        return self.k_max(n) // self.tile_k + 1
+
+    def _tile_len(self, n, t):
+        return min(self.tile_k, self.k_max(n) + 1 - t * self.tile_k)
+
+    def _write_tile(self, n, t, values):
+        path = self._tile_path(n, t)
+        write_bigtable(path + ".tmp", {"count": values})
+        os.replace(path + ".tmp", path)
+
+    def tile(self, n, t):
+        """Tile t of row n as a list of ints, through the LRU cache."""
+        key = (n, t)
+        prof = instrument.current
+        if prof is not None:
+            prof.cache("tiledp.tiles", key in self._cache)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key][0]
+        with BigTable(self._tile_path(n, t)) as table:
+            values = table.column("count")
+        size = sum(v.bit_length() // 8 + 32 for v in values)
+        self._cache[key] = (values, size)
+        self._cache_bytes += size
+        while self._cache_bytes > self.ram_budget and len(self._cache) > 1:
+            _, (_, evicted) = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted
+        return values
+
+    # -------------------------------------------------------------------------
+    # DP
+    # -------------------------------------------------------------------------
+
+    def _output_tile(self, n, t):
+        from height import poly_mul_trunc
+        tk = self.tile_k
+        lo = t * tk
+        out = [0] * self._tile_len(n, t)
+        prof = instrument.current
+        for i in range(1, n // 2 + 1):
+            j = n - i
+            weight = 1 if i == j else 2
+            f = self.root_term(n, i)
+            # Tile pair (ta, tb) covers k in [(ta+tb) tk + f, (ta+tb+2) tk - 2 + f].
+            s_min = max(0, -(-(lo - f - 2 * tk + 2) // tk))
+            s_max = (lo - f + len(out) - 1) // tk
+            for ta in range(self.num_tiles(i)):
+                for tb in range(max(0, s_min - ta), min(self.num_tiles(j) - 1, s_max - ta) + 1):
+                    a = self.tile(i, ta)
+                    b = self.tile(j, tb)
+                    prod = poly_mul_trunc(a, b, len(a) + len(b) - 1)
+                    if prof is not None:
+                        prof.products("tiledp.poly_mul", [max(a).bit_length()], [max(b).bit_length()],
+                                      add=len(a) * len(b))
+                    start = (ta + tb) * tk + f - lo
+                    first = max(0, -start)
+                    last = min(len(prod), len(out) - start)
+                    for idx in range(first, last):
+                        if prod[idx]:
+                            out[start + idx] += weight * prod[idx]
+        return out
+
+    def build(self, n_max):
+        """Extend the table to all rows n <= n_max, resuming after the last completed row."""
+        if self.completed == 0 and n_max >= 1:
+            self._write_tile(1, 0, [1])
+            self.completed = 1
+            self._write_manifest()
+        for n in range(self.completed + 1, n_max + 1):
+            with instrument.Timer(instrument.current, "tiledp", n):
+                for t in range(self.num_tiles(n)):
+                    if not os.path.exists(self._tile_path(n, t)):
+                        self._write_tile(n, t, self._output_tile(n, t))
+            self.completed = n
+            self._write_manifest()
+
+    # -------------------------------------------------------------------------
+    # Access
+    # -------------------------------------------------------------------------
+
+    def value(self, n, k):
+        """c[n][k], the number of trees with n leaves and invariant value k."""
+        if n > self.completed:
+            raise ValueError(f"Row {n} has not been built (completed through {self.completed}).")
+        if not 0 <= k <= self.k_max(n):
+            return 0
+        return self.tile(n, k // self.tile_k)[k % self.tile_k]
+
+    def row(self, n):
+        """Row n as a dict {k: count} of its nonzero entries."""
+        out = {}
+        for t in range(self.num_tiles(n)):
+            for offset, v in enumerate(self.tile(n, t)):
+                if v:
+                    out[t * self.tile_k + offset] = v
+        return out
+
+
+def in_memory_distribution(invariant, n_max):
+    """Reference DP with every row in memory (the cherry.py scheme)."""
+    root_term, _ = INVARIANTS[invariant]
+    c = [None, {0: 1}]
+    for n in range(2, n_max + 1):
+        row = {}
+        for i in range(1, n):
+            f = root_term(n, i)
+            for a, x in c[i].items():
+                for b, y in c[n - i].items():
+                    row[a + b + f] = row.get(a + b + f, 0) + x * y
+        c.append(row)
+    return c
+
+
+class TestTiledDP(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_matches_in_memory_dp(self):
+        N = 16
+        for invariant in INVARIANTS:
+            expected = in_memory_distribution(invariant, N)
+            table = TiledDistribution(os.path.join(self.tmp, invariant), invariant, tile_k=5)
+            table.build(N)
+            for n in range(1, N + 1):
+                self.assertEqual(table.row(n), expected[n], (invariant, n))
+
+    def test_cherries_match_cherry_py(self):
+        from cherry import build_cherry_coeff_table
+        ctable = build_cherry_coeff_table(14)
+        table = TiledDistribution(os.path.join(self.tmp, "c"), "cherries", tile_k=2)
+        table.build(15)
+        for n in range(1, 16):
+            self.assertEqual(table.row(n), {k: v for k, v in ctable[n - 1].items() if v})
+
+    def test_small_budget_and_resume(self):
+        N = 14
+        expected = in_memory_distribution("sackin", N)
+        path = os.path.join(self.tmp, "s")
+        table = TiledDistribution(path, "sackin", tile_k=4, ram_budget=1)
+        table.build(9)
+        self.assertLessEqual(len(table._cache), 1)
+        # Simulate an interrupted build of row 10: some tiles written, manifest not advanced.
+        table.build(10)
+        for t in range(1, table.num_tiles(10)):
+            os.remove(table._tile_path(10, t))
+        table.completed = 9
+        table._write_manifest()
+        resumed = TiledDistribution(path, "sackin", tile_k=99)
+        self.assertEqual((resumed.completed, resumed.tile_k), (9, 4))
+        resumed.build(N)
+        for n in range(1, N + 1):
+            self.assertEqual(resumed.row(n), expected[n])
+        self.assertEqual(resumed.value(N, 10 ** 6), 0)
+        with self.assertRaises(ValueError):
+            TiledDistribution(path, "colless")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Array encoding of full binary trees.
+
+A tree with n leaves is stored as two int32 arrays `left` and `right` of
+length 2n - 1 that list the nodes in post-order: both children of a node
+appear before it, the root is the last entry, and a leaf has
+left[v] == right[v] == -1.  Every routine below is a single forward or
+backward sweep over these arrays, so trees with millions of leaves can be
+processed without recursion or per-node Python objects.
+
+The nested-tuple form used throughout the test scripts ("L" for a leaf,
+(left, right) for an internal node) converts to and from this encoding.
+"""
+
+import unittest
+from array import array
+
+LEAF = -1
+
+
+def from_nested(tree):
+    """
+    Convert a nested-tuple tree ("L" or (left, right)) to post-order arrays.
+    Returns (left, right) as array('i').
+    """
+    left = array('i')
+    right = array('i')
+    # Explicit stack of (subtree, expanded) pairs; a node is emitted only
+    # after both of its children have been emitted.
+    stack = [(tree, False)]
+    emitted = []
+    while stack:
+        node, expanded = stack.pop()
+        if node == "L":
+            left.append(LEAF)
+            right.append(LEAF)
+            emitted.append(len(left) - 1)
+        elif expanded:
+            r = emitted.pop()
+            l = emitted.pop()
+            left.append(l)
+            right.append(r)
+            emitted.append(len(left) - 1)
+        else:
+            stack.append((node, True))
+            stack.append((node[1], False))
+            stack.append((node[0], False))
+    return left, right
+
+
+def to_nested(left, right):
+    """Convert post-order arrays back to the nested-tuple form."""
+    built = [None] * len(left)
+    for v in range(len(left)):
+        if left[v] == LEAF:
+            built[v] = "L"
+        else:
+            built[v] = (built[left[v]], built[right[v]])
+    return built[-1]
+
+
+def num_leaves(left):
+    """Return the number of leaves of an encoded tree."""
+    return (len(left) + 1) // 2
+
+
+def leaves_below(left, right):
+    """Return an array giving the number of leaves in the subtree of each node."""
+    size = array('i', [1]) * len(left)
+    for v in range(len(left)):
+        if left[v] != LEAF:
+            size[v] = size[left[v]] + size[right[v]]
+    return size
+
+
+def node_depths(left, right):
+    """Return an array giving the depth of each node (the root has depth 0)."""
+    depth = array('i', [0]) * len(left)
+    for v in range(len(left) - 1, -1, -1):
+        if left[v] != LEAF:
+            depth[left[v]] = depth[v] + 1
+            depth[right[v]] = depth[v] + 1
+    return depth
+
+
+class TestTreeArray(unittest.TestCase):
+
+    def test_round_trip(self):
+        for tree in ["L", ("L", "L"), (("L", "L"), "L"), ("L", (("L", "L"), ("L", "L")))]:
+            left, right = from_nested(tree)
+            self.assertEqual(to_nested(left, right), tree)
+
+    def test_post_order_layout(self):
+        left, right = from_nested((("L", "L"), "L"))
+        self.assertEqual(list(left), [-1, -1, 0, -1, 2])
+        self.assertEqual(list(right), [-1, -1, 1, -1, 3])
+
+    def test_sizes_and_depths(self):
+        left, right = from_nested((("L", "L"), "L"))
+        self.assertEqual(num_leaves(left), 3)
+        self.assertEqual(list(leaves_below(left, right)), [1, 1, 2, 1, 3])
+        self.assertEqual(list(node_depths(left, right)), [2, 2, 1, 1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+Compact On-Disk Tree Batches with Memory-Mapped Access
+
+Nested tuples, test5.Tree objects and ("node", L, R) tuples cost hundreds of
+bytes per node.  A tree batch stores many trees in one file in one of two
+encodings:
+
+  - "arrays": the post-order left and right int32 arrays of treearray.py,
+    back to back (8 bytes per node).  Reading a tree returns NumPy views into
+    the memory map, i.e. no copy at all.
+  - "dyck":   one bit per node, packed into bytes per tree.  The bits are the
+    post-order node types (1 = internal) in reverse, which is the pre-order
+    word of the mirrored tree and therefore self-delimiting, so no length is
+    stored.  Decoding rebuilds the arrays with boltzmann.postorder_arrays.
+
+File layout (little-endian):
+    8 bytes   magic b"UTTTREE1"
+    uint32    encoding (0 = arrays, 1 = dyck), uint32 reserved
+    uint64    number of trees, uint64 position of the index
+    data      tree records, starting at byte 32
+    index     uint64 (count + 1) byte offsets of the records, relative to 32
+The writer streams records and writes the index and header on close.
+"""
+
+import struct
+import unittest
+
+import numpy as np
+
+MAGIC = b"UTTTREE1"
+ENCODINGS = ("arrays", "dyck")
+_HEADER = struct.Struct("<8sIIQQ")
+
+
+def _dyck_bytes(left):
+    internal = np.asarray(left) != -1
+    return np.packbits(internal[::-1]).tobytes()
+
+
+def _from_dyck(raw):
+    from boltzmann import postorder_arrays
+    bits = np.unpackbits(np.frombuffer(raw, dtype=np.uint8)).astype(bool)
+    slots = 1 + np.cumsum(np.where(bits, 1, -1))
+    m = int(np.argmax(slots == 0)) + 1
+    return postorder_arrays(bits[:m][::-1])
+
+
+class TreeBatchWriter:
+    """Streaming writer; use as a context manager or call close()."""
+
+    def __init__(self, path, encoding="arrays"):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding {encoding!r}; choose from {ENCODINGS}.")
+        self.encoding = encoding
+        self._file = open(path, "wb")
+        self._file.write(b"\0" * _HEADER.size)
+        self._offsets = [0]
+
+    def append(self, left, right):
+        """Append one tree given as post-order arrays."""
+        if self.encoding == "arrays":
+            data = (np.asarray(left, dtype="<i4").tobytes()
+                    + np.asarray(right, dtype="<i4").tobytes())
+        else:
+            data = _dyck_bytes(left)
+        self._file.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+    def extend(self, trees):
+        for left, right in trees:
+            self.append(left, right)
+
+    def close(self):
+        position = _HEADER.size + self._offsets[-1]
+        np.asarray(self._offsets, dtype="<u8").tofile(self._file)
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, ENCODINGS.index(self.encoding), 0,
+                                      len(self._offsets) - 1, position))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_batch(path, trees, encoding="arrays"):
+    """Write an iterable of (left, right) trees to a batch file."""
+    with TreeBatchWriter(path, encoding) as writer:
+        writer.extend(trees)
+
+
+class TreeBatch:
+    """Memory-mapped reader of a tree batch; indexable and iterable."""
+
+    def __init__(self, path):
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, encoding, _, count, position = _HEADER.unpack(self._map[:_HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a tree batch.")
+        self.encoding = ENCODINGS[encoding]
+        self._count = count
+        self._offsets = np.ndarray((count + 1,), dtype="<u8", buffer=self._map,
+                                   offset=position)
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, k):
+        if not 0 <= k < self._count:
+            raise IndexError(k)
+        start = _HEADER.size + int(self._offsets[k])
+        return start, _HEADER.size + int(self._offsets[k + 1])
+
+    def __getitem__(self, k):
+        """Tree k as post-order (left, right) int32 arrays."""
+        start, stop = self._record(k)
+        if self.encoding == "arrays":
+            m = (stop - start) // 8
+            nodes = np.ndarray((2, m), dtype="<i4", buffer=self._map, offset=start)
+            return nodes[0], nodes[1]
+        return _from_dyck(self._map[start:stop])
+
+    def __iter__(self):
+        for k in range(self._count):
+            yield self[k]
+
+    def num_nodes(self, k):
+        """Number of nodes of tree k; O(1) for the arrays encoding."""
+        start, stop = self._record(k)
+        if self.encoding == "arrays":
+            return (stop - start) // 8
+        return len(self[k][0])
+
+    @property
+    def nbytes(self):
+        """Size of the tree records in bytes."""
+        return int(self._offsets[-1])
+
+
+class TestTreeBatch(unittest.TestCase):
+
+    def test_round_trip_both_encodings(self):
+        import os
+        import random
+        import tempfile
+        from splitmodels import random_tree
+        rng = random.Random(6)
+        trees = [random_tree(rng.randrange(1, 200), rng=rng) for _ in range(200)]
+        with tempfile.TemporaryDirectory() as tmp:
+            for encoding in ENCODINGS:
+                path = os.path.join(tmp, encoding)
+                write_batch(path, trees, encoding)
+                batch = TreeBatch(path)
+                self.assertEqual(len(batch), len(trees))
+                self.assertEqual(batch.encoding, encoding)
+                for k, (left, right) in enumerate(batch):
+                    self.assertEqual((left.tolist(), right.tolist()), trees[k])
+                    self.assertEqual(batch.num_nodes(k), len(trees[k][0]))
+            nodes = sum(len(t[0]) for t in trees)
+            self.assertEqual(TreeBatch(os.path.join(tmp, "arrays")).nbytes, 8 * nodes)
+            self.assertLess(TreeBatch(os.path.join(tmp, "dyck")).nbytes, nodes / 8 + len(trees))
+
+    def test_zero_copy_and_errors(self):
+        import os
+        import tempfile
+        from boltzmann import boltzmann_tree
+        left, right = boltzmann_tree(50000, rng=np.random.default_rng(2))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "big")
+            write_batch(path, [(left, right)] * 3)
+            batch = TreeBatch(path)
+            l1, r1 = batch[1]
+            self.assertIsInstance(l1.base, np.ndarray)
+            self.assertFalse(l1.flags.owndata)
+            np.testing.assert_array_equal(r1, right)
+            with self.assertRaises(IndexError):
+                batch[3]
+            with open(os.path.join(tmp, "bad"), "wb") as f:
+                f.write(b"\0" * 64)
+            with self.assertRaises(ValueError):
+                TreeBatch(os.path.join(tmp, "bad"))
+            with self.assertRaises(ValueError):
+                TreeBatchWriter(os.path.join(tmp, "x"), "newick")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,341 @@
+"""
+treeinv: Command-Line Access to the Invariant Engines
+
+The test scripts print their tables or plot them.  This script writes the
+numbers instead, one subcommand per engine:
+
+    python treeinv.py totals --invariants S,C,Phi --n-max 100000 --format binary -o totals
+    python treeinv.py distribution --invariant sackin --n-max 200 --table cache/sackin
+    python treeinv.py sample --n 500 --count 10000 --model yule --seed 3 -o sample.csv
+    python treeinv.py score corpus/*.nwk --cache shapes.sqlite --format parquet -o scores.parquet
+
+  - totals:        exact totals from core.closed_form_rows (only Colless
+                   keeps a history);
+  - distribution:  rows (n, k, count) of a tiledp.TiledDistribution, which is
+                   built row by row in --table and reused across runs;
+  - sample:        per-tree invariants of random trees of a split model
+                   (splitmodels.py), tree i drawn from its own seed;
+  - score:         per-tree invariants of Newick corpora (pipeline.py), through
+                   a persistent shapecache.InvariantCache with --cache.
+
+Rows are written as they are produced.  Formats:
+  - csv:      text, to a file or stdout ("-", the default);
+  - binary:   a columnar.py table directory, flushed every --chunk-rows rows;
+  - parquet:  one row group per --chunk-rows rows, exact integers beyond
+              int64 as decimal strings (needs pyarrow).
+With --resume, a csv file or binary table left by an earlier (possibly
+interrupted) run with the same arguments is continued after its last complete
+row.  Totals have ~0.6 n decimal digits, so main() lifts CPython's
+int-to-str digit limit for the run and restores it on return.
+
+Startup matters because the tool is called from shell pipelines: this file
+imports only the standard library, and each subcommand imports its engine
+when it runs, so `totals` never loads NumPy, or even unittest.  The tests
+live in test_treeinv.py for the same reason.
+"""
+
+import argparse
+import os
+import sys
+from itertools import islice
+
+INVARIANTS = ("S", "C", "Phi", "X", "S2")
+TOTALS = ("T",) + INVARIANTS
+
+
+class UsageError(ValueError):
+    """An invalid combination of arguments, reported with the usage line."""
+
+
+# -----------------------------------------------------------------------------
+# Output sinks: append(row), rows (already present), existing(column), close()
+# -----------------------------------------------------------------------------
+
+class CsvSink:
+
+    def __init__(self, path, schema, resume=False, chunk_rows=None):
+        self.columns = [name for name, _ in schema]
+        self.rows = 0
+        if path in (None, "-"):
+            if resume:
+                raise UsageError("--resume needs an output file.")
+            self._file = sys.stdout
+            self._file.write(",".join(self.columns) + "\n")
+            self._owned = False
+        else:
+            if resume and os.path.exists(path):
+                self._truncate_partial(path)
+                with open(path) as f:
+                    header = f.readline().rstrip("\n").split(",")
+                    if header != self.columns:
+                        raise UsageError(f"Cannot resume {path}: its columns are {header}.")
+                    self.rows = sum(1 for _ in f)
+                self._file = open(path, "a")
+            else:
+                self._file = open(path, "w")
+                self._file.write(",".join(self.columns) + "\n")
+            self._owned = True
+        self.path = path
+
+    @staticmethod
+    def _truncate_partial(path):
+        """Drop a trailing line without its newline, left by an interrupted run."""
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def append(self, row):
+        self._file.write(",".join(map(str, row)) + "\n")
+        self._file.flush()
+        self.rows += 1
+
+    def existing(self, column):
+        index = self.columns.index(column)
+        with open(self.path) as f:
+            next(f)
+            return [int(line.split(",")[index]) for line in islice(f, self.rows)]
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+
+
+class BinarySink:
+
+    def __init__(self, path, schema, resume=False, chunk_rows=1024):
+        from columnar import ColumnarWriter
+        if path in (None, "-"):
+            raise UsageError("--format binary needs an output directory.")
+        self.columns = [name for name, _ in schema]
+        self.path = path
+        try:
+            self._writer = ColumnarWriter(path, schema, chunk_rows=chunk_rows, append=resume)
+        except ValueError as e:
+            raise UsageError(str(e)) from None
+        self.rows = self._writer.rows
+
+    def append(self, row):
+        self._writer.append(**dict(zip(self.columns, row)))
+        self.rows += 1
+
+    def existing(self, column):
+        from columnar import ColumnarTable
+        return ColumnarTable(self.path).values(column)[:self.rows]
+
+    def close(self):
+        self._writer.close()
+
+
+class ParquetSink:
+
+    def __init__(self, path, schema, resume=False, chunk_rows=1024):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise UsageError("--format parquet needs pyarrow (pip install pyarrow).") from None
+        if path in (None, "-"):
+            raise UsageError("--format parquet needs an output file.")
+        if resume:
+            raise UsageError("Parquet files cannot be appended to; use csv or binary to resume.")
+        self._pa = pa
+        types = {"int64": pa.int64(), "float64": pa.float64(), "bigint": pa.string()}
+        self._schema = pa.schema([(name, types[kind]) for name, kind in schema])
+        self._kinds = [kind for _, kind in schema]
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._buffer = []
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+
+    def append(self, row):
+        self._buffer.append([str(v) if kind == "bigint" else v for v, kind in zip(row, self._kinds)])
+        self.rows += 1
+        if len(self._buffer) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            columns = [self._pa.array(list(c), type=f.type)
+                       for c, f in zip(zip(*self._buffer), self._schema)]
+            self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+            self._buffer = []
+
+    def existing(self, column):
+        return []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+SINKS = {"csv": CsvSink, "binary": BinarySink, "parquet": ParquetSink}
+
+
+def _write(args, schema, rows_after):
+    """Open the sink, write rows_after(rows already present, sink), close."""
+    sink = SINKS[args.format](args.output, schema, args.resume, args.chunk_rows)
+    try:
+        for row in rows_after(sink.rows, sink):
+            sink.append(row)
+    finally:
+        sink.close()
+    return sink.rows
+
+
+# -----------------------------------------------------------------------------
+# Subcommands
+# -----------------------------------------------------------------------------
+
+def _totals(args):
+    names = args.invariants.split(",") if args.invariants else list(TOTALS)
+    unknown = set(names) - set(TOTALS)
+    if unknown:
+        raise UsageError(f"Unknown invariants {sorted(unknown)}; choose from {TOTALS}.")
+    columns = [TOTALS.index(name) + 1 for name in names]
+
+    def rows(done, sink):
+        from core import closed_form_rows
+        C_history = [0] + sink.existing("C") if done and "C" in names else None
+        for row in closed_form_rows(args.n_max, done + 1, "C" in names, C_history):
+            yield (row[0],) + tuple(row[c] for c in columns)
+
+    return _write(args, [("n", "int64")] + [(name, "bigint") for name in names], rows)
+
+
+def _distribution(args):
+    if args.table is not None:
+        return _distribution_in(args, args.table)
+    import tempfile
+    with tempfile.TemporaryDirectory(prefix=args.invariant) as directory:
+        return _distribution_in(args, directory)
+
+
+def _distribution_in(args, directory):
+    from tiledp import TiledDistribution
+    try:
+        table = TiledDistribution(directory, args.invariant, tile_k=args.tile_k,
+                                  ram_budget=args.ram_budget)
+    except ValueError as e:
+        raise UsageError(str(e)) from None
+
+    def rows(done, sink):
+        def produce():
+            for n in range(args.n_min, args.n_max + 1):
+                table.build(n)
+                for k, count in sorted(table.row(n).items()):
+                    yield n, k, count
+        return islice(produce(), done, None)
+
+    return _write(args, [("n", "int64"), ("k", "int64"), ("count", "bigint")], rows)
+
+
+def _tree_schema():
+    return [("index", "int64"), ("n", "int64")] + [(name, "int64") for name in INVARIANTS]
+
+
+def _sample(args):
+    import random
+    from montecarlo import _model, tree_invariants
+    from splitmodels import random_tree
+    if args.model not in ("pda", "yule"):
+        try:
+            float(args.model)
+        except ValueError:
+            raise UsageError(f"Unknown model {args.model!r}; use pda, yule or a number.") from None
+    try:
+        model = _model(args.model)
+    except ValueError as e:
+        raise UsageError(str(e)) from None
+
+    def rows(done, sink):
+        for index in range(done, args.count):
+            left, right = random_tree(args.n, model, rng=random.Random(f"{args.seed}:{index}"))
+            yield (index, args.n) + tree_invariants(left, right)
+
+    return _write(args, _tree_schema(), rows)
+
+
+def _score(args):
+    from pipeline import from_newick, read_newick, score_corpus
+
+    def rows(done, sink):
+        trees = islice(read_newick(args.paths), done, None)
+        if args.cache is None:
+            scored = score_corpus(trees, workers=args.workers, chunk_size=args.chunk_size)
+        else:
+            from shapecache import InvariantCache
+            scored = _cached(trees, InvariantCache(path=args.cache), from_newick)
+        for index, row in enumerate(scored, done):
+            yield (index,) + tuple(row)
+
+    return _write(args, _tree_schema(), rows)
+
+
+def _cached(trees, cache, from_newick):
+    with cache:
+        for text in trees:
+            left, right = from_newick(text)
+            yield ((len(left) + 1) // 2,) + tuple(cache.score(left, right))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="treeinv", description="Tree shape invariants.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(name, function, help):
+        sub = commands.add_parser(name, help=help)
+        sub.set_defaults(function=function)
+        sub.add_argument("-o", "--output", default="-",
+                         help="output file or directory ('-' is stdout for csv)")
+        sub.add_argument("--format", choices=sorted(SINKS), default="csv")
+        sub.add_argument("--resume", action="store_true",
+                         help="continue an output left by an earlier run")
+        sub.add_argument("--chunk-rows", type=int, default=1024,
+                         help="rows per flush of binary and parquet output")
+        return sub
+
+    sub = command("totals", _totals, "exact totals over all trees with n leaves")
+    sub.add_argument("--n-max", type=int, required=True)
+    sub.add_argument("--invariants", help=f"comma-separated subset of {','.join(TOTALS)}")
+
+    sub = command("distribution", _distribution, "exact distribution of one invariant")
+    sub.add_argument("--invariant", choices=("cherries", "sackin", "colless"), required=True)
+    sub.add_argument("--n-max", type=int, required=True)
+    sub.add_argument("--n-min", type=int, default=1)
+    sub.add_argument("--table", help="persistent table directory, reused across runs")
+    sub.add_argument("--tile-k", type=int, default=256)
+    sub.add_argument("--ram-budget", type=int, default=256 << 20, help="tile cache bytes")
+
+    sub = command("sample", _sample, "invariants of random trees")
+    sub.add_argument("--n", type=int, required=True, help="leaves per tree")
+    sub.add_argument("--count", type=int, required=True)
+    sub.add_argument("--model", default="pda", help="pda, yule or a beta-splitting beta")
+    sub.add_argument("--seed", type=int, default=0)
+
+    sub = command("score", _score, "invariants of the trees in Newick files")
+    sub.add_argument("paths", nargs="+")
+    sub.add_argument("--workers", type=int)
+    sub.add_argument("--chunk-size", type=int, default=64)
+    sub.add_argument("--cache", help="SQLite file of a persistent shape cache (runs in-process)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    limit = sys.get_int_max_str_digits() if hasattr(sys, "get_int_max_str_digits") else None
+    if limit is not None:
+        sys.set_int_max_str_digits(0)
+    try:
+        args.function(args)
+    except UsageError as e:
+        parser.error(str(e))
+    finally:
+        if limit is not None:
+            sys.set_int_max_str_digits(limit)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())